@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from PIL import Image, ImageOps
+
+STORE_DIR = "art_output"
+INDEX_FILE = "index.db"
+MAX_DISK_BYTES = 1024 * 1024 * 1024
+THUMB_EDGE = 256
+# JPEG decodes several times faster than PNG and is a fraction of the size
+MASTER_QUALITY = 95
+VARIANT_QUALITY = 90
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+class ArtStore:
+    """
+    Generated art per track: the master render, a thumbnail and display-size
+    variants, plus an index of how it was made (prompt hash, model, dims, seed,
+    timings). Whole tracks are evicted least recently used first past MAX_DISK_BYTES.
+    Safe to share between the GUI and the render worker process.
+    """
+    def __init__(self, root=STORE_DIR, max_bytes=MAX_DISK_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        # Reentrant: has() imports legacy art through save_master while holding it
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(root, INDEX_FILE), check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "track_id TEXT PRIMARY KEY, prompt_hash TEXT, model TEXT, width INTEGER, height INTEGER, "
+            "seed INTEGER, timings TEXT, created_at REAL, last_used REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, track_id TEXT NOT NULL, kind TEXT NOT NULL, "
+            "width INTEGER, height INTEGER, bytes INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_track ON files (track_id)")
+        self.conn.commit()
+
+    # --- writing (render worker) ---
+    def save_master(self, track_id, image, prompt="", model="", seed=None, timings=None):
+        """Stores a finished render, replacing any older art for the track."""
+        image = image.convert("RGB")
+        with self._lock:
+            self._delete_track(track_id)
+            self.conn.execute(
+                "INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (track_id, prompt_hash(prompt) if prompt else None, model, image.width, image.height,
+                 seed, json.dumps(timings or {}), time.time(), time.time()),
+            )
+            self._write_file(track_id, "master", image, MASTER_QUALITY)
+            thumb = image.copy()
+            thumb.thumbnail((THUMB_EDGE, THUMB_EDGE), Image.Resampling.LANCZOS)
+            self._write_file(track_id, "thumb", thumb, VARIANT_QUALITY)
+            self._evict()
+            self.conn.commit()
+
+    # --- reading (GUI) ---
+    def has(self, track_id):
+        # Check and import together, so a second caller racing the import sees the indexed art
+        with self._lock:
+            if self._row(track_id):
+                return True
+            return self._import_legacy(track_id)
+
+    def master_path(self, track_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT path FROM files WHERE track_id = ? AND kind = 'master'", (track_id,)
+            ).fetchone()
+        return os.path.join(self.root, row[0]) if row else None
+
+    def lookup(self, track_id, display_size):
+        """
+        Path of the art at display_size. A missing size is made once by
+        rescaling the master (no new render) and kept as a variant.
+        """
+        if not self.has(track_id):
+            return None
+        width, height = display_size
+        with self._lock:
+            self.conn.execute("UPDATE tracks SET last_used = ? WHERE track_id = ?", (time.time(), track_id))
+            self.conn.commit()
+            row = self.conn.execute(
+                "SELECT path FROM files WHERE track_id = ? AND kind = 'display' AND width = ? AND height = ?",
+                (track_id, width, height),
+            ).fetchone()
+            if row:
+                return os.path.join(self.root, row[0])
+            master = self.conn.execute(
+                "SELECT path FROM files WHERE track_id = ? AND kind = 'master'", (track_id,)
+            ).fetchone()
+        if not master:
+            return None
+
+        source = Image.open(os.path.join(self.root, master[0])).convert("RGB")
+        variant = ImageOps.fit(source, (width, height), method=Image.Resampling.LANCZOS)
+        with self._lock:
+            path = self._write_file(track_id, "display", variant, VARIANT_QUALITY)
+            self._evict()
+            self.conn.commit()
+        return os.path.join(self.root, path)
+
+    def metadata(self, track_id):
+        with self._lock:
+            row = self._row(track_id)
+        if not row:
+            return None
+        keys = ["track_id", "prompt_hash", "model", "width", "height", "seed", "timings", "created_at", "last_used"]
+        meta = dict(zip(keys, row))
+        meta["timings"] = json.loads(meta["timings"] or "{}")
+        return meta
+
+    # --- internals (caller holds the lock) ---
+    def _row(self, track_id):
+        return self.conn.execute("SELECT * FROM tracks WHERE track_id = ?", (track_id,)).fetchone()
+
+    def _write_file(self, track_id, kind, image, quality):
+        suffix = "" if kind == "master" else f"_{kind}_{image.width}x{image.height}"
+        path = f"{track_id}{suffix}.jpg"
+        full = os.path.join(self.root, path)
+        image.save(full, "JPEG", quality=quality)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (path, track_id, kind, image.width, image.height, os.path.getsize(full)),
+        )
+        return path
+
+    def _delete_track(self, track_id):
+        for (path,) in self.conn.execute("SELECT path FROM files WHERE track_id = ?", (track_id,)).fetchall():
+            try:
+                os.remove(os.path.join(self.root, path))
+            except OSError:
+                pass
+        self.conn.execute("DELETE FROM files WHERE track_id = ?", (track_id,))
+        self.conn.execute("DELETE FROM tracks WHERE track_id = ?", (track_id,))
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for (track_id,) in self.conn.execute("SELECT track_id FROM tracks ORDER BY last_used").fetchall():
+            freed = self.conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM files WHERE track_id = ?", (track_id,)
+            ).fetchone()[0]
+            self._delete_track(track_id)
+            total -= freed
+            if total <= self.max_bytes:
+                break
+
+    def _import_legacy(self, track_id):
+        """Art from before the store existed (art_output/<id>.png) is indexed on first use."""
+        legacy = os.path.join(self.root, f"{track_id}.png")
+        if not os.path.exists(legacy):
+            return False
+        try:
+            self.save_master(track_id, Image.open(legacy))
+            os.remove(legacy)
+            return True
+        except Exception as e:
+            print(f"Art store import error ({track_id}): {e}")
+            return False
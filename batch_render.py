@@ -0,0 +1,315 @@
+"""
+Headless art pre-rendering for playlists and libraries, e.g. overnight, so
+playback finds the art already in the art store.
+
+    python batch_render.py tracks.json
+    python batch_render.py playlist.csv                       # Exportify playlist export
+    python batch_render.py https://open.spotify.com/playlist/<id>
+
+Lyrics fetching and LLM prompting run concurrently, ahead of the single
+diffusion consumer, with bounded queues in between. Progress is kept in
+PROGRESS_FILE, so an interrupted run picks up where it stopped.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+from lyrics_provider import FreeLyricsHandler
+from prompt_cache import PromptCache
+from art_store import ArtStore
+from tracing import tracer
+
+PROGRESS_FILE = "batch_progress.json"
+# Bounded hand-offs: lyrics may run this far ahead of prompting, prompting this far ahead of diffusion
+LYRICS_QUEUE_SIZE = 8
+PROMPT_QUEUE_SIZE = 4
+PROMPT_WORKERS = 2
+LYRICS_TIMEOUT_S = 15
+MAX_ATTEMPTS = 3
+ASPECT = (16, 9)
+
+_DONE = object()  # end-of-stream marker passed down the queues
+
+def load_tracks(source):
+    """Tracks from a JSON list, an Exportify CSV or a Spotify playlist id/URI/URL."""
+    if source.lower().endswith(".json"):
+        with open(source, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        tracks = data.get("tracks", []) if isinstance(data, dict) else data
+        return [dict(t, genres=t.get("genres") or []) for t in tracks if t.get("id") and t.get("title")]
+
+    if source.lower().endswith(".csv"):
+        tracks = []
+        with open(source, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                uri = row.get("Track URI") or ""
+                if not uri.startswith("spotify:track:"):
+                    continue  # local files, episodes
+                tracks.append({
+                    "id": uri.split(":")[-1],
+                    "title": row.get("Track Name", ""),
+                    "artist": (row.get("Artist Name(s)") or "").split(",")[0].strip(),
+                    "album_art": row.get("Album Image URL") or None,
+                    "genres": [g for g in (row.get("Artist Genres") or row.get("Genres") or "").split(",") if g],
+                    "duration_ms": int(row.get("Duration (ms)") or row.get("Track Duration (ms)") or 0),
+                })
+        return tracks
+
+    from spotify_client import SpotifyHandler
+    return SpotifyHandler().get_playlist_tracks(source)
+
+class Progress:
+    """Per-track status in a JSON file, rewritten after every change."""
+    def __init__(self, path=PROGRESS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.items = json.load(f)
+        except:
+            self.items = {}
+
+    def status(self, track_id):
+        return self.items.get(track_id, {})
+
+    def mark(self, track_id, status, error=None):
+        with self._lock:
+            item = self.items.setdefault(track_id, {"attempts": 0})
+            item["status"] = status
+            item["updated_at"] = time.time()
+            if status == "failed":
+                item["attempts"] += 1
+                item["error"] = error
+            else:
+                item.pop("error", None)
+            self._save()
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, indent=2)
+        os.replace(tmp, self.path)
+
+class BatchRenderer:
+    """
+    lyrics (feeder + FreeLyricsHandler pool) -> lyrics_q -> PROMPT_WORKERS x
+    TranslatorService -> prompt_q -> one ImageGenerator on the calling thread,
+    which renders whatever prompts are waiting in one generate_batch call.
+    """
+    def __init__(self, tracks, width, height, steps=None, prompt_workers=PROMPT_WORKERS, progress=None,
+                 art_store=None):
+        self.tracks = tracks
+        self.width = width
+        self.height = height
+        self.steps = steps
+        self.prompt_workers = prompt_workers
+        self.progress = progress or Progress()
+        self.art_store = art_store or ArtStore()
+        self.lyrics_engine = FreeLyricsHandler()
+        self.lyrics_q = queue.Queue(maxsize=LYRICS_QUEUE_SIZE)
+        self.prompt_q = queue.Queue(maxsize=PROMPT_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.stats = {"rendered": 0, "skipped": 0, "failed": 0, "render_s": 0.0, "starved_s": 0.0}
+
+    def pending(self):
+        todo = []
+        seen = set()
+        for track in self.tracks:
+            # Playlists can list a track twice; it is rendered once, in first-seen order
+            if track["id"] in seen:
+                continue
+            seen.add(track["id"])
+            item = self.progress.status(track["id"])
+            if item.get("status") == "done" or self.art_store.has(track["id"]):
+                self.stats["skipped"] += 1
+            elif item.get("attempts", 0) >= MAX_ATTEMPTS:
+                self.stats["skipped"] += 1
+                print(f"⏭ Giving up on '{track['title']}' after {item['attempts']} attempts: {item.get('error')}")
+            else:
+                todo.append(track)
+        return todo
+
+    def run(self):
+        todo = self.pending()
+        print(f"🎞 {len(todo)} to render, {self.stats['skipped']} already done or skipped")
+        if not todo:
+            return self.stats
+
+        start = time.perf_counter()
+        threading.Thread(target=self._feed_lyrics, args=(todo,), daemon=True).start()
+        # Every prompt worker shares one cache so repeated songs are prompted once
+        cache = PromptCache()
+        workers = [
+            threading.Thread(target=self._prompt_worker, args=(cache,), daemon=True)
+            for _ in range(self.prompt_workers)
+        ]
+        for w in workers:
+            w.start()
+        threading.Thread(target=self._close_prompt_queue, args=(workers,), daemon=True).start()
+
+        try:
+            # The model loads while the first lyrics and prompts are already being produced
+            from image_generator import ImageGenerator
+            generator = ImageGenerator(art_store=self.art_store)
+            self._render_loop(generator, len(todo), start)
+        except KeyboardInterrupt:
+            print("\n⏹ Interrupted; progress is saved, run again to resume")
+            self.stop_event.set()
+        self.stats["wall_s"] = time.perf_counter() - start
+        return self.stats
+
+    # --- stages ---
+    def _feed_lyrics(self, todo):
+        for track in todo:
+            if self.stop_event.is_set():
+                break
+            # fetch_async returns at once; the bounded queue keeps it from running far ahead
+            self._put(self.lyrics_q, (track, self.lyrics_engine.fetch_async(track)))
+        for _ in range(self.prompt_workers):
+            self._put(self.lyrics_q, _DONE)
+
+    def _prompt_worker(self, cache):
+        from translator_service import TranslatorService
+        translator = TranslatorService(cache=cache)
+        while True:
+            item = self.lyrics_q.get()
+            if item is _DONE:
+                return
+            track, lyrics_future = item
+            with tracer.job(track["id"]):
+                try:
+                    with tracer.span("lyrics"):
+                        _, lyrics = lyrics_future.result(timeout=LYRICS_TIMEOUT_S)
+                except Exception:
+                    lyrics = ""
+                if not lyrics:
+                    lyrics = f"{track['title']} {' '.join(track.get('genres', []))}"
+                try:
+                    with tracer.span("prompt"):
+                        prompt, _, _ = translator.create_smart_prompt(
+                            track["title"], track["artist"], lyrics, track.get("genres", [])
+                        )
+                except Exception as e:
+                    self._failed(track, f"prompt: {e}")
+                    continue
+                # A canned prompt would render the same generic art for every track and mark it done
+                fallbacks = translator.fallback_passes()
+                if fallbacks:
+                    self._failed(track, f"prompt: LLM unavailable ({', '.join(fallbacks)} fell back)")
+                    continue
+            self._put(self.prompt_q, (track, prompt))
+
+    def _close_prompt_queue(self, workers):
+        for w in workers:
+            w.join()
+        self._put(self.prompt_q, _DONE)
+
+    def _render_loop(self, generator, total, start):
+        done = 0
+        finished = False
+        while not finished:
+            waited = time.perf_counter()
+            item = self.prompt_q.get()
+            self.stats["starved_s"] += time.perf_counter() - waited
+            if item is _DONE:
+                return
+            # Every job has the same size, so whatever is already waiting joins this batch
+            batch = [item]
+            while len(batch) < generator.max_batch:
+                try:
+                    item = self.prompt_q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+
+            jobs = [
+                {"prompt": prompt, "track_id": track["id"], "album_art_url": track.get("album_art"),
+                 "width": self.width, "height": self.height}
+                for track, prompt in batch
+            ]
+            render_start = time.perf_counter()
+            try:
+                with tracer.job(batch[0][0]["id"]), tracer.span("render"):
+                    generator.generate_batch(jobs, steps=self.steps)
+            except Exception as e:
+                for track, _ in batch:
+                    self._failed(track, f"render: {e}")
+                continue
+            finally:
+                self.stats["render_s"] += time.perf_counter() - render_start
+
+            for track, _ in batch:
+                self.progress.mark(track["id"], "done")
+                self.stats["rendered"] += 1
+                done += 1
+                elapsed = time.perf_counter() - start
+                per_item = elapsed / done
+                print(f"✅ [{done}/{total}] {track['artist']} - {track['title']} | "
+                      f"{3600 / per_item:.1f} items/h | ETA {(total - done) * per_item / 60:.0f} min")
+
+    def _failed(self, track, error):
+        print(f"❌ {track.get('title', track['id'])}: {error}")
+        self.stats["failed"] += 1
+        self.progress.mark(track["id"], "failed", error)
+
+    def _put(self, q, item):
+        # Blocks while the next stage is behind, but gives up once the run is stopped
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+def generation_size(long_edge, aspect=ASPECT):
+    """Landscape size for the render profile's long edge, multiples of 8 as SD needs."""
+    width = long_edge // 8 * 8
+    height = int(long_edge * aspect[1] / aspect[0]) // 8 * 8
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render AI art for a playlist or track list.")
+    parser.add_argument("source", help="tracks JSON, Exportify CSV, or Spotify playlist id/URI/URL")
+    parser.add_argument("--size", help="WIDTHxHEIGHT (default: render profile long edge at 16:9)")
+    parser.add_argument("--steps", type=int, help="denoising steps (default: render profile)")
+    parser.add_argument("--prompt-workers", type=int, default=PROMPT_WORKERS)
+    parser.add_argument("--progress", default=PROGRESS_FILE)
+    parser.add_argument("--limit", type=int, help="only the first N tracks")
+    args = parser.parse_args()
+
+    tracer.configure()
+    tracks = load_tracks(args.source)[:args.limit]
+    if args.size:
+        width, height = (int(v) // 8 * 8 for v in args.size.lower().split("x"))
+    else:
+        from render_profiles import load_profile
+        import torch
+        width, height = generation_size(load_profile(cuda_available=torch.cuda.is_available())["long_edge"])
+    print(f"📋 {len(tracks)} tracks from {args.source} | rendering at {width}x{height}")
+
+    renderer = BatchRenderer(
+        tracks, width, height, steps=args.steps, prompt_workers=args.prompt_workers,
+        progress=Progress(args.progress)
+    )
+    stats = renderer.run()
+    renderer.lyrics_engine.save_cache()
+
+    if stats.get("wall_s"):
+        hours = stats["wall_s"] / 3600
+        print(f"\n📊 {stats['rendered']} rendered, {stats['failed']} failed, {stats['skipped']} skipped "
+              f"in {stats['wall_s'] / 60:.1f} min | {stats['rendered'] / hours:.1f} items/h")
+        # Time the diffusion stage sat idle waiting for prompts: the pipeline is prompt-bound if high
+        print(f"   diffusion busy {stats['render_s'] / 60:.1f} min, waited {stats['starved_s'] / 60:.1f} min for prompts")
+    tracer.print_summary()
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
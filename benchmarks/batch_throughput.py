@@ -0,0 +1,49 @@
+"""
+Images/minute for one-at-a-time generate_image vs batched generate_batch.
+Run from the repo root: python benchmarks/batch_throughput.py [num_images]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_generator import ImageGenerator
+
+PROMPTS = [
+    "A lone lighthouse in a violet storm, Melancholic atmosphere",
+    "Neon rain over an empty boulevard, Dreamy atmosphere",
+    "A forest of glass trees at dawn, Euphoric atmosphere",
+    "A dancer dissolving into smoke, Aggressive atmosphere",
+]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    width, height = 768, 432
+    jobs = [
+        {
+            "prompt": PROMPTS[i % len(PROMPTS)],
+            "track_id": f"bench_{i}",
+            "album_art_url": None,
+            "width": width,
+            "height": height,
+        }
+        for i in range(count)
+    ]
+
+    generator = ImageGenerator()
+    generator.generate_image(PROMPTS[0], "bench_warmup", None, width, height)  # CUDA warm-up
+
+    start = time.perf_counter()
+    for job in jobs:
+        generator.generate_image(job["prompt"], job["track_id"], None, width, height)
+    serial = 60 * count / (time.perf_counter() - start)
+
+    batched = generator.generate_batch(jobs)
+
+    print(f"\nSerial:  {serial:.1f} images/min")
+    print(f"Batched: {batched:.1f} images/min (max batch {generator.max_batch})")
+    print(f"Speedup: {batched / serial:.2f}x")
+
+if __name__ == "__main__":
+    main()
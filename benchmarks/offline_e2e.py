@@ -0,0 +1,238 @@
+"""
+End-to-end benchmark without any network or GPU: replays a recorded listening
+session against local fakes (benchmarks/offline_fakes.py) and reports
+time-to-album-art, time-to-AI-art, throughput and per-stage costs. The app's
+own TrackPipeline runs against a headless view, with the real RenderClient
+and render process (tiny diffusion pipeline, stub translator).
+
+Run from the repo root:
+    python benchmarks/offline_e2e.py [--session benchmarks/sessions/sample.json] [--speed 20]
+    python benchmarks/offline_e2e.py --save-baseline     # after an intended change in cost
+Results are compared with benchmarks/baselines/<name>.json; anything more than
+TOLERANCE worse is flagged and the exit code is 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import functools
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# The repo root goes first: benchmarks/render_profiles.py must not shadow the real module
+sys.path.insert(0, ROOT)
+
+from offline_fakes import FakeServices, ReplaySpotify, ServiceLatency, offline_services
+from frame_channel import LatestFrameChannel
+from track_pipeline import TrackPipeline
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+TOLERANCE = 0.2
+SCREEN = (1280, 720)
+# Smallest built-in profile, so the tiny pipeline's cost is dominated by the code paths around it
+RENDER_PROFILE = "fast"
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else None
+
+class HeadlessView:
+    """
+    Stands in for SpotifyAIApp's window: records when album art and AI art
+    would have been on screen for the playing track, measured from the
+    moment that track started in the replay.
+    """
+    def __init__(self):
+        self.preview_channel = LatestFrameChannel()
+        self.display_size = SCREEN
+        self.pipeline = None
+        self.fake = None
+        self.album_art_s = {}
+        self.ai_art_s = {}
+
+    def start_pass(self, fake):
+        self.fake = fake
+        self.album_art_s, self.ai_art_s = {}, {}
+
+    def _since_start(self, track_id):
+        return time.monotonic() - self.fake.track_started_at(self.fake.index_of(track_id))
+
+    def update_image_display(self, image_path_or_url, is_url=False):
+        import requests
+
+        track_id = self.pipeline.current_track_id
+        if is_url:
+            requests.get(image_path_or_url, timeout=5)
+            self.album_art_s[track_id] = self._since_start(track_id)
+        elif image_path_or_url is not None:
+            self.ai_art_s.setdefault(track_id, self._since_start(track_id))
+
+    def update_info(self, title, artist):
+        pass
+
+    def set_playing(self, is_playing):
+        pass
+
+class CountingPipeline(TrackPipeline):
+    """The app's TrackPipeline, also counting freshly rendered tracks (cached art arrives as a path)."""
+    def __init__(self, *args, **kwargs):
+        self.rendered = set()
+        super().__init__(*args, **kwargs)
+
+    def on_art_ready(self, track, art):
+        if not isinstance(art, str):
+            self.rendered.add(track["id"])
+        super().on_art_ready(track, art)
+
+def run_pass(pipeline, view, fake):
+    from poll_scheduler import PollScheduler
+    from spotify_client import SpotifyHandler
+
+    # Same caches and render process as the previous pass, new session
+    pipeline.spotify = SpotifyHandler(sp=fake)
+    pipeline.poller = PollScheduler()
+    pipeline.last_track_id = pipeline.current_track_id = None
+    pipeline.rendered = set()
+    view.start_pass(fake)
+
+    start = time.perf_counter()
+    fake.start()
+    while not fake.finished():
+        pipeline.poller.wait(pipeline.poll())
+    wall_s = time.perf_counter() - start
+    # Leftover work from this session must not run into the next one
+    pipeline.scheduler.drop_prefetch()
+    pipeline.scheduler.supersede(None)
+
+    tracks = [t["id"] for t in fake.tracks]
+    album = [view.album_art_s[t] for t in tracks if t in view.album_art_s]
+    ai = [view.ai_art_s[t] for t in tracks if t in view.ai_art_s]
+    return {
+        "tracks": len(tracks),
+        "album_art_p50_s": _percentile(album, 0.5),
+        "album_art_p95_s": _percentile(album, 0.95),
+        "ai_art_p50_s": _percentile(ai, 0.5),
+        "ai_art_p95_s": _percentile(ai, 0.95),
+        "ai_art_missed": len(tracks) - len(ai),
+        "images_per_min": 60 * len(pipeline.rendered) / wall_s,
+        "spotify_calls": fake.api_calls,
+    }
+
+def compare(result, baseline):
+    """Returns (metric, baseline, now) for everything more than TOLERANCE worse."""
+    regressions = []
+    for name, old in baseline.items():
+        new = result.get(name)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        higher_is_better = name == "images_per_min"
+        worse = old - new if higher_is_better else new - old
+        # Absolute slack for counters and tiny timings, relative otherwise
+        if worse > max(abs(old) * TOLERANCE, 0.05 if name.endswith("_s") else 0):
+            regressions.append((name, old, new))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--session", default=os.path.join(ROOT, "benchmarks", "sessions", "sample.json"))
+    parser.add_argument("--speed", type=float, default=20.0, help="replay speed-up of the recorded session")
+    parser.add_argument("--passes", type=int, default=2, help="later passes reuse the caches of earlier ones")
+    parser.add_argument("--name", default="offline_e2e", help="baseline name")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--lyrics-latency", type=float, default=0.15)
+    parser.add_argument("--translate-latency", type=float, default=0.2)
+    parser.add_argument("--ollama-first-token", type=float, default=0.3)
+    parser.add_argument("--ollama-token", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with open(args.session, "r", encoding="utf-8") as f:
+        session = json.load(f)
+    latency = ServiceLatency(
+        lyrics=args.lyrics_latency, translate=args.translate_latency,
+        ollama_first_token=args.ollama_first_token, ollama_token=args.ollama_token,
+    )
+    services = FakeServices(session, latency).start()
+    # lyrics_sources and the ollama client read these at import time; the render
+    # process inherits them, and TRACE=1 makes it send its spans back
+    os.environ.update(services.environ())
+    os.environ["RENDER_PROFILE"] = RENDER_PROFILE
+    os.environ["TRACE"] = "1"
+    workdir = tempfile.mkdtemp(prefix="offline_e2e_")
+    os.chdir(workdir)  # every cache and the art store start empty
+
+    from tracing import tracer
+    tracer.configure(enabled=True, log_path=os.path.join(workdir, "traces.jsonl"), port=None)
+    from spotify_client import SpotifyHandler
+    from lyrics_provider import FreeLyricsHandler
+    from art_store import ArtStore
+
+    view = HeadlessView()
+    first = ReplaySpotify(session, services.art_url, speed=args.speed)
+    pipeline = CountingPipeline(
+        view, SpotifyHandler(sp=first), FreeLyricsHandler(), ArtStore(), SCREEN,
+        services=functools.partial(offline_services, translate_latency=latency.translate),
+    )
+    view.pipeline = pipeline
+    from render_worker import WorkerCrashed
+    load_start = time.perf_counter()
+    try:
+        pipeline.render_client.wait_ready()
+    except WorkerCrashed as e:
+        print(e)
+        pipeline.stop()
+        return 1
+    print(f"Render worker ready after {time.perf_counter() - load_start:.1f}s")
+
+    results = []
+    for n in range(args.passes):
+        fake = first if n == 0 else ReplaySpotify(session, services.art_url, speed=args.speed)
+        print(f"▶ Pass {n + 1}/{args.passes} ({'cold' if n == 0 else 'warm'}, {fake.length_s:.0f}s)")
+        results.append(run_pass(pipeline, view, fake))
+    pipeline.stop()
+
+    stages = {stage: {"count": c, "p50_s": p50, "p95_s": p95} for stage, (c, p50, p95) in tracer.summary().items()}
+    result = dict(results[0])
+    for key, value in results[-1].items():
+        result[f"warm_{key}"] = value
+    for stage, s in stages.items():
+        result[f"stage_{stage}_p50_s"] = s["p50_s"]
+
+    print(f"\nSession: {os.path.basename(args.session)} | {result['tracks']} tracks at {args.speed:g}x")
+    for key, value in result.items():
+        if value is not None and not key.startswith("stage_"):
+            print(f"   {key:<26} {value:.3f}" if isinstance(value, float) else f"   {key:<26} {value}")
+    print()
+    tracer.print_summary()
+    print(f"   fake service requests: {services.requests}")
+
+    config = {"session": os.path.basename(args.session), "speed": args.speed, "passes": args.passes,
+              "screen": list(SCREEN), "profile": RENDER_PROFILE, "latency": latency.as_dict()}
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.name}.json")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "metrics": result, "saved_at": time.strftime("%Y-%m-%d %H:%M")}, f, indent=2)
+        print(f"\nBaseline saved to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path} yet (run with --save-baseline)")
+        return 0
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print("\n⚠️ Baseline was recorded with different settings; comparison is indicative only")
+    regressions = compare(result, baseline["metrics"])
+    if not regressions:
+        print(f"\n✅ Within {TOLERANCE:.0%} of the baseline from {baseline['saved_at']}")
+        return 0
+    print(f"\n❌ Regressions against the baseline from {baseline['saved_at']}:")
+    for name, old, new in regressions:
+        print(f"   {name:<26} {old:.3f} -> {new:.3f}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
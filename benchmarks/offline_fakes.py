@@ -0,0 +1,374 @@
+"""
+Local stand-ins for every external service the art pipeline talks to, used by
+benchmarks/offline_e2e.py: a replayed Spotify session, one HTTP server playing
+LRCLIB, lyrics.ovh, the album art CDN and Ollama, a stub translator and a tiny
+randomly initialized diffusion pipeline (offline_services puts the last two
+into the render worker).
+
+Record a session from the real account (play some music first):
+    python benchmarks/offline_fakes.py record benchmarks/sessions/mine.json [minutes]
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import tempfile
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+# Canned Ollama answer in the merged field order, so every pass finds its fields.
+# The trailing chatter is what early stopping is meant to save.
+OLLAMA_REPLY = (
+    "MOOD: Melancholic\n"
+    "SINGER_GENDER: Male\n"
+    "SUBJECT_GENDER: Female\n"
+    'KEY_PHRASES: "Streetlights bleeding into rain", "A letter never sent", "Echoes in an empty hall"\n'
+    "SETTING: Urban night\n"
+    "VISUAL: A mystical woman made of rain walks through a neon city at night\n"
+    "I hope this helps capture the feeling of the song. Let me know if you would like "
+    "a different interpretation or a more abstract scene for the artwork.\n"
+)
+
+def _clean(s):
+    # Same normalization as lyrics_sources.clean, so lookups match what providers send
+    return re.sub(r"[^\w\s\-']", "", s).strip().lower()
+
+class ServiceLatency:
+    """Seconds of artificial latency per fake service (Ollama is per token plus time to first token)."""
+    def __init__(self, lyrics=0.15, art=0.1, translate=0.2, ollama_first_token=0.3, ollama_token=0.02):
+        self.lyrics = lyrics
+        self.art = art
+        self.translate = translate
+        self.ollama_first_token = ollama_first_token
+        self.ollama_token = ollama_token
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+class FakeServices:
+    """
+    One local HTTP server for all remote APIs:
+      /lrclib/get?artist_name=&track_name=   LRCLIB
+      /ovh/<artist>/<title>                  lyrics.ovh
+      /art/<track_id>                        album art (a flat color JPEG)
+      /api/generate                          Ollama (streamed NDJSON or one JSON)
+    """
+    def __init__(self, session, latency=None):
+        self.latency = latency or ServiceLatency()
+        self.lyrics = {}
+        for entry in session["tracks"]:
+            self.lyrics[(_clean(entry["artist"]), _clean(entry["title"]))] = entry
+        self.requests = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def environ(self):
+        """Environment that points lyrics_sources and the ollama client here. Set before importing them."""
+        return {
+            "LRCLIB_URL": f"{self.url}/lrclib",
+            "LYRICS_OVH_URL": f"{self.url}/ovh",
+            "LYRICS_DIR": tempfile.mkdtemp(prefix="lyrics_"),  # nothing local
+            "OLLAMA_HOST": self.url,
+        }
+
+    def art_url(self, track_id):
+        return f"{self.url}/art/{track_id}"
+
+    def _count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [unquote(p) for p in url.path.strip("/").split("/")]
+                if parts[0] == "lrclib":
+                    services._count("lrclib")
+                    query = parse_qs(url.query)
+                    entry = services.lyrics.get((
+                        _clean(query.get("artist_name", [""])[0]), _clean(query.get("track_name", [""])[0])
+                    ))
+                    time.sleep(services.latency.lyrics)
+                    if not entry or not entry.get("synced_lyrics"):
+                        return self._send(404, {"message": "not found"})
+                    return self._send(200, {"syncedLyrics": entry["synced_lyrics"], "plainLyrics": None})
+                if parts[0] == "ovh" and len(parts) == 3:
+                    services._count("lyrics.ovh")
+                    entry = services.lyrics.get((_clean(parts[1]), _clean(parts[2])))
+                    time.sleep(services.latency.lyrics)
+                    if not entry or not entry.get("lyrics"):
+                        return self._send(404, {"error": "No lyrics found"})
+                    return self._send(200, {"lyrics": entry["lyrics"]})
+                if parts[0] == "art" and len(parts) == 2:
+                    services._count("art")
+                    time.sleep(services.latency.art)
+                    color = zlib.crc32(parts[1].encode("utf-8")) & 0xFFFFFF
+                    buffer = io.BytesIO()
+                    Image.new("RGB", (300, 300), f"#{color:06x}").save(buffer, "JPEG")
+                    return self._send_bytes(200, buffer.getvalue(), "image/jpeg")
+                self._send(404, {"error": "unknown route"})
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    return self._send(404, {"error": "unknown route"})
+                services._count("ollama")
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                tokens = re.findall(r"\S+\s*", OLLAMA_REPLY)
+                time.sleep(services.latency.ollama_first_token)
+                if not body.get("stream", True):
+                    time.sleep(services.latency.ollama_token * len(tokens))
+                    return self._send(200, {
+                        "model": body.get("model"), "response": OLLAMA_REPLY, "done": True,
+                        "eval_count": len(tokens), "prompt_eval_count": len(body.get("prompt", "")) // 4,
+                    })
+
+                # Streamed: one JSON object per line, connection closed at the end
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        self._line({"model": body.get("model"), "response": token, "done": False})
+                        time.sleep(services.latency.ollama_token)
+                    self._line({
+                        "model": body.get("model"), "response": "", "done": True,
+                        "eval_count": len(tokens), "prompt_eval_count": len(body.get("prompt", "")) // 4,
+                    })
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client stopped early, as intended
+
+            def _line(self, obj):
+                self.wfile.write((json.dumps(obj) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            def _send(self, status, obj):
+                self._send_bytes(status, json.dumps(obj).encode("utf-8"), "application/json")
+
+            def _send_bytes(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class ReplaySpotify:
+    """
+    Stands in for spotipy.Spotify: plays a recorded session back `speed` times
+    faster. Durations and positions are reported in replay time, so polling and
+    deadline logic behave as they would on a track `speed` times shorter.
+    """
+    def __init__(self, session, art_url, speed=20.0, clock=time.monotonic):
+        self.tracks = session["tracks"]
+        self.art_url = art_url
+        self.speed = speed
+        self.clock = clock
+        self.started = None
+        self.api_calls = 0
+        # Replay-time start of each track; a track plays for played_ms (a skip if shorter than its duration)
+        self.starts = []
+        offset = 0.0
+        for entry in self.tracks:
+            self.starts.append(offset)
+            offset += entry.get("played_ms", entry["duration_ms"]) / speed / 1000
+        self.length_s = offset
+
+    def start(self):
+        self.started = self.clock()
+
+    def track_started_at(self, index):
+        """Clock time the track at `index` started playing."""
+        return self.started + self.starts[index]
+
+    def index_of(self, track_id):
+        for i, entry in enumerate(self.tracks):
+            if entry["id"] == track_id:
+                return i
+        return None
+
+    def finished(self):
+        return self.started is not None and self.clock() - self.started >= self.length_s
+
+    def _position(self):
+        elapsed = self.clock() - self.started
+        for i in reversed(range(len(self.tracks))):
+            if elapsed >= self.starts[i]:
+                if elapsed - self.starts[i] >= self.tracks[i].get("played_ms", self.tracks[i]["duration_ms"]) / self.speed / 1000:
+                    return None, 0  # session over
+                return i, (elapsed - self.starts[i]) * 1000
+        return None, 0
+
+    def _item(self, entry):
+        return {
+            "id": entry["id"],
+            "name": entry["title"],
+            "artists": [{"id": entry.get("artist_id", _clean(entry["artist"])), "name": entry["artist"]}],
+            "album": {"images": [{"url": self.art_url(entry["id"])}]},
+            "duration_ms": int(entry["duration_ms"] / self.speed),
+        }
+
+    # --- the spotipy calls SpotifyHandler makes ---
+    def current_user_playing_track(self):
+        self.api_calls += 1
+        index, progress = self._position()
+        if index is None:
+            return None
+        return {"item": self._item(self.tracks[index]), "progress_ms": int(progress), "is_playing": True}
+
+    def queue(self):
+        self.api_calls += 1
+        index, _ = self._position()
+        if index is None:
+            return {"queue": []}
+        return {"queue": [self._item(entry) for entry in self.tracks[index + 1:]]}
+
+    def artist(self, artist_id):
+        self.api_calls += 1
+        for entry in self.tracks:
+            if entry.get("artist_id", _clean(entry["artist"])) == artist_id:
+                return {"genres": entry.get("genres", [])}
+        return {"genres": []}
+
+    def next_track(self): self.api_calls += 1
+    def previous_track(self): self.api_calls += 1
+    def pause_playback(self): self.api_calls += 1
+    def start_playback(self): self.api_calls += 1
+
+class StubTranslator:
+    """Replaces GoogleTranslator: returns the text unchanged after a fixed delay."""
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return text
+
+def _tiny_tokenizer():
+    """A CLIP tokenizer over single byte-level characters, built without downloading anything."""
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    chars = list(bytes_to_unicode().values())
+    vocab = {"<|startoftext|>": 0, "!": 1, "<|endoftext|>": 2}
+    for token in chars + [c + "</w>" for c in chars]:
+        vocab.setdefault(token, len(vocab))
+    folder = tempfile.mkdtemp(prefix="tiny_clip_")
+    with open(os.path.join(folder, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(folder, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(
+        os.path.join(folder, "vocab.json"), os.path.join(folder, "merges.txt"), model_max_length=77
+    ), len(vocab)
+
+def tiny_pipeline(seed=0):
+    """
+    Randomly initialized img2img pipeline with the SD 1.x structure but a few
+    million parameters. The images are noise; the point is exercising every
+    code path (VAE encode, UNet steps, callbacks, decode) in well under a second.
+    """
+    import torch
+    from diffusers import (
+        AutoencoderKL, PNDMScheduler, StableDiffusionImg2ImgPipeline, UNet2DConditionModel
+    )
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(seed)
+    tokenizer, vocab_size = _tiny_tokenizer()
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=2, sample_size=32, in_channels=4, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), cross_attention_dim=32,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 64], in_channels=3, out_channels=3, latent_channels=4,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0, eos_token_id=2, pad_token_id=1, hidden_size=32, intermediate_size=37,
+        num_attention_heads=4, num_hidden_layers=5, vocab_size=vocab_size, max_position_embeddings=77,
+    ))
+    return StableDiffusionImg2ImgPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+        scheduler=PNDMScheduler(skip_prk_steps=True), safety_checker=None,
+        feature_extractor=None, requires_safety_checker=False,
+    )
+
+def offline_services(preview_channel, preview_every, translate_latency=0.2):
+    """
+    render_worker.default_services with the stub translator and the tiny
+    pipeline. Runs in the render process; pass it to RenderClient(services=...)
+    bound with functools.partial, which the spawn context can pickle.
+    """
+    from translator_service import TranslatorService
+    from image_generator import ImageGenerator
+
+    translator = TranslatorService()
+    translator.translator = StubTranslator(translate_latency)
+    side_translator = TranslatorService(cache=translator.cache)
+    side_translator.translator = StubTranslator(translate_latency)
+    generator = ImageGenerator(preview_channel=preview_channel, preview_every=preview_every, pipe=tiny_pipeline())
+    return translator, side_translator, generator
+
+def record_session(path, minutes=30, poll_s=5):
+    """Polls the real account and writes what was played, in the format ReplaySpotify reads."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from spotify_client import SpotifyHandler
+    from lyrics_provider import FreeLyricsHandler
+    from synced_lyrics import is_synced, plain_lyrics
+
+    spotify = SpotifyHandler()
+    lyrics = FreeLyricsHandler()
+    tracks = []
+    end = time.time() + minutes * 60
+    while time.time() < end:
+        track = spotify.get_current_track()
+        if track:
+            if not tracks or tracks[-1]["id"] != track["id"]:
+                if tracks:
+                    tracks[-1]["played_ms"] = int((time.time() - tracks[-1].pop("_started")) * 1000)
+                print(f"● {track['artist']} - {track['title']}")
+                raw = lyrics._fetch_raw(track)
+                tracks.append({
+                    "id": track["id"], "title": track["title"], "artist": track["artist"],
+                    "genres": track["genres"], "duration_ms": track["duration_ms"],
+                    "lyrics": plain_lyrics(raw),
+                    "synced_lyrics": raw if is_synced(raw) else None,
+                    "_started": time.time() - track["progress_ms"] / 1000,
+                })
+        time.sleep(poll_s)
+    if tracks:
+        tracks[-1]["played_ms"] = int((time.time() - tracks[-1].pop("_started")) * 1000)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"recorded_at": time.strftime("%Y-%m-%d %H:%M"), "tracks": tracks}, f, indent=2, ensure_ascii=False)
+    print(f"Saved {len(tracks)} tracks to {path}")
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "record":
+        record_session(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 30)
+    else:
+        print(__doc__)
@@ -0,0 +1,66 @@
+"""
+Seconds per image and peak RSS for each render profile.
+Every profile runs in its own process so peak RSS is not shared between them.
+Run from the repo root: python benchmarks/render_profiles.py [profile ...]
+"""
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RUNS = 3
+PROMPT = "A lone lighthouse in a violet storm, Melancholic atmosphere, cinematic lighting"
+
+def run_profile(name):
+    """Child process: load the profile, render RUNS images, print one JSON line."""
+    from image_generator import ImageGenerator
+    from render_profiles import fit_long_edge
+
+    start = time.perf_counter()
+    generator = ImageGenerator(profile=name)
+    load_s = time.perf_counter() - start
+
+    long_edge = fit_long_edge(generator.profile, 16 / 9)
+    width, height = long_edge, (int(long_edge * 9 / 16) // 8) * 8
+
+    timings = []
+    for i in range(RUNS):
+        start = time.perf_counter()
+        generator.generate_image(PROMPT, f"bench_profile_{name}", None, width, height)
+        timings.append(time.perf_counter() - start)
+
+    # ru_maxrss is KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "profile": name, "size": f"{width}x{height}", "steps": generator.steps,
+        "load_s": load_s, "first_s": timings[0], "sec_per_image": min(timings[1:] or timings),
+        "peak_rss_mb": peak_rss_mb,
+    }))
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        run_profile(sys.argv[2])
+        return
+
+    from render_profiles import PROFILES
+    names = sys.argv[1:] or list(PROFILES)
+    print(f"{'profile':<12} {'size':>9} {'steps':>5} {'load':>7} {'s/image':>8} {'peak RSS':>10}")
+    for name in names:
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", name], cwd=ROOT, capture_output=True, text=True
+        )
+        lines = [l for l in result.stdout.splitlines() if l.startswith("{")]
+        if result.returncode != 0 or not lines:
+            print(f"{name:<12} failed: {result.stderr.strip().splitlines()[-1:]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{r['profile']:<12} {r['size']:>9} {r['steps']:>5} {r['load_s']:>6.1f}s "
+              f"{r['sec_per_image']:>7.1f}s {r['peak_rss_mb']:>8.0f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Startup cost: import time of each module in a fresh interpreter, and the time
+from a cold start to the first track's info and album art being available.
+Run from the repo root: python benchmarks/startup.py
+"""
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODULES = ["spotify_client", "lyrics_provider", "gui_app", "translator_service", "image_generator"]
+
+def import_time(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def time_to_first_track():
+    """Mirrors stage 1 of SpotifyAIApp.init_services without opening a window."""
+    start = time.perf_counter()
+    import requests
+    from spotify_client import SpotifyHandler
+
+    spotify = SpotifyHandler()
+    track = spotify.get_current_track()
+    if not track:
+        return None
+    if track.get("album_art"):
+        requests.get(track["album_art"], timeout=5)
+    return time.perf_counter() - start
+
+def main():
+    print("Import time (fresh interpreter):")
+    for module in MODULES:
+        seconds = import_time(module)
+        print(f"  {module:<20} {'failed' if seconds is None else f'{seconds:.3f}s'}")
+
+    seconds = time_to_first_track()
+    if seconds is None:
+        print("Time to first track: nothing playing")
+    else:
+        print(f"Time to first track: {seconds:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import threading
+
+class LatestFrameChannel:
+    """
+    Single-slot mailbox between the render thread and the GUI. put() replaces
+    any frame the GUI has not picked up yet, so the GUI only ever sees the newest.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.dropped = 0
+
+    def put(self, track_id, image):
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = (track_id, image)
+
+    def get_nowait(self):
+        """Returns (track_id, image) or None if nothing new arrived."""
+        with self._lock:
+            item, self._item = self._item, None
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._item = None
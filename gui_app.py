@@ -5,12 +5,29 @@ import time
 import os
 import requests
 from io import BytesIO
+from collections import OrderedDict, deque
 
 # Import your existing modules
+# (translator_service and image_generator pull in ollama/torch/diffusers; they
+# only ever load inside the render worker process, see render_worker.py)
 from spotify_client import SpotifyHandler
 from lyrics_provider import FreeLyricsHandler
-from translator_service import TranslatorService
-from image_generator import ImageGenerator
+from frame_channel import LatestFrameChannel
+from track_pipeline import TrackPipeline
+from art_store import ArtStore
+from tracing import tracer
+
+PREVIEW_POLL_MS = 100
+# The lyric line follows a local clock between (now infrequent) Spotify polls
+LYRIC_TICK_MS = 250
+
+# Resizing: a cheap bilinear fit while the window moves, LANCZOS once it settles
+RESIZE_DEBOUNCE_MS = 150
+SCALE_CACHE_SIZE = 6
+# Same darkening as the old black overlay at alpha 80, as a per-channel lookup table
+OVERLAY_LUT = [int(v * (1 - 80 / 255)) for v in range(256)] * 3
+
+APP_START = time.perf_counter()
 
 class SpotifyAIApp:
     def __init__(self, root):
@@ -32,9 +49,21 @@ class SpotifyAIApp:
         # --- State Variables ---
         self.is_playing = False
         self.running = True
+        self.current_line = ""
+        self.preview_channel = LatestFrameChannel()
+        # Polling, track changes and rendering (track_pipeline.py); set once services are up
+        self.pipeline = None
         # Initial placeholder: Black screen sized to monitor
         self.current_image_pil = Image.new('RGB', (self.screen_width, self.screen_height), "#000000")
         self.photo_ref = None 
+        # Scaled, darkened display frames keyed by (image version, size, high quality)
+        self.image_version = 0
+        self.display_size = (self.screen_width, self.screen_height)
+        self.shown_key = None
+        self.scale_cache = OrderedDict()
+        self.scale_lock = threading.Lock()
+        self.refine_after_id = None
+        self.display_stats = {"fast": deque(maxlen=200), "hq": deque(maxlen=200)}
 
         # --- UI Setup (Canvas) ---
         self.setup_canvas_ui()
@@ -45,6 +74,11 @@ class SpotifyAIApp:
 
     def exit_app(self, event=None):
         self.running = False
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline.print_poll_stats()
+        self.print_display_stats()
+        tracer.print_summary()
         self.root.destroy()
 
     def setup_canvas_ui(self):
@@ -63,6 +97,11 @@ class SpotifyAIApp:
         self.artist_shadow = self.canvas.create_text(52, 102, text="", font=("Arial", 20), fill="black", anchor="nw")
         self.artist_item = self.canvas.create_text(50, 100, text="", font=("Arial", 20), fill="#dddddd", anchor="nw")
 
+        # --- Synced Lyric Line (above controls) ---
+        ly = self.screen_height - 240
+        self.lyric_shadow = self.canvas.create_text(self.screen_width / 2 + 2, ly + 2, text="", font=("Arial", 26, "italic"), fill="black")
+        self.lyric_item = self.canvas.create_text(self.screen_width / 2, ly, text="", font=("Arial", 26, "italic"), fill="white")
+
         # --- Controls Layer (Bottom Center) ---
         self.create_controls()
 
@@ -89,73 +128,130 @@ class SpotifyAIApp:
         self.canvas.tag_bind("btn", "<Leave>", lambda e: self.canvas.config(cursor=""))
 
     def init_services(self):
+        # Stage 1: everything needed for track info and album art
         try:
-            self.spotify = SpotifyHandler()
-            self.lyrics_engine = FreeLyricsHandler()
-            self.translator = TranslatorService()
-            self.generator = ImageGenerator()
-            threading.Thread(target=self.main_loop, daemon=True).start()
+            spotify = SpotifyHandler()
+            lyrics_engine = FreeLyricsHandler()
+            art_store = ArtStore()
+            # TRACE=1: per-stage spans to traces.jsonl and a Prometheus endpoint
+            tracer.configure()
+            # Spawns the render worker; its models load in the background
+            self.pipeline = TrackPipeline(
+                self, spotify, lyrics_engine, art_store, (self.screen_width, self.screen_height),
+                started_at=APP_START
+            )
+            threading.Thread(target=self.pipeline.main_loop, daemon=True).start()
+            self.root.after(PREVIEW_POLL_MS, self.poll_previews)
+            self.root.after(LYRIC_TICK_MS, self.tick_lyrics)
+            print(f"⏱ Services live after {time.perf_counter() - APP_START:.2f}s")
         except Exception as e:
             print(f"Init Error: {e}")
 
     def on_resize(self, event=None):
         """Ensures image covers the screen perfectly."""
-        w = self.root.winfo_width()
-        h = self.root.winfo_height()
-        
-        # Resize current image to fit window exactly
-        resized = ImageOps.fit(self.current_image_pil, (w, h), method=Image.Resampling.LANCZOS)
-        self.photo_ref = ImageTk.PhotoImage(resized)
-        
-        self.canvas.itemconfig(self.bg_item, image=self.photo_ref)
-        self.canvas.tag_lower("bg") # Keep image behind text
+        # <Configure> on root also fires for every child widget
+        if event is not None and event.widget is not self.root:
+            return
+        size = (self.root.winfo_width(), self.root.winfo_height())
+        if size == self.display_size or min(size) <= 1:
+            return
+        self.display_size = size
+
+        # Fast scale right away, high quality once the resize has settled
+        self.show_current(hq=False)
+        if self.refine_after_id:
+            self.root.after_cancel(self.refine_after_id)
+        self.refine_after_id = self.root.after(RESIZE_DEBOUNCE_MS, self._refine_display)
 
         # Update control positions in case window size changes
-        cx = w / 2
-        cy = h - 120
+        cx = size[0] / 2
+        cy = size[1] - 120
         # (Updating individual items by tag/id if needed, simplified here)
 
-    def calculate_generation_dims(self):
+    def scaled_frame(self, hq=True):
+        """Current image fitted to the window and darkened; cached per (image, size)."""
+        with self.scale_lock:
+            image, version, size = self.current_image_pil, self.image_version, self.display_size
+            # A cached high quality frame is always better than a fresh fast one
+            for key in ((version, size, True), (version, size, hq)):
+                if key in self.scale_cache:
+                    self.scale_cache.move_to_end(key)
+                    return key, self.scale_cache[key]
+
+        start, cpu_start = time.perf_counter(), time.process_time()
+        method = Image.Resampling.LANCZOS if hq else Image.Resampling.BILINEAR
+        # Apply dark overlay for text readability, at display resolution only
+        frame = ImageOps.fit(image, size, method=method)
+        if frame.mode != "RGB":
+            frame = frame.convert("RGB")  # worker frames arrive as shared-memory RGBX
+        frame = frame.point(OVERLAY_LUT)
+        self.display_stats["hq" if hq else "fast"].append(
+            ((time.perf_counter() - start) * 1000, (time.process_time() - cpu_start) * 1000)
+        )
+
+        key = (version, size, hq)
+        with self.scale_lock:
+            self.scale_cache[key] = frame
+            while len(self.scale_cache) > SCALE_CACHE_SIZE:
+                self.scale_cache.popitem(last=False)
+        return key, frame
+
+    def _refine_display(self):
+        self.refine_after_id = None
+        self.show_current(hq=True)
+
+    def show_current(self, hq=True):
+        """Puts the current image on the canvas. Tk thread only."""
+        key, frame = self.scaled_frame(hq)
+        if key == self.shown_key:
+            return
+        self.shown_key = key
+        self.photo_ref = ImageTk.PhotoImage(frame)
+        self.canvas.itemconfig(self.bg_item, image=self.photo_ref)
+        self.canvas.tag_lower("bg") # Keep image behind text
+
+    def print_display_stats(self):
+        for kind, samples in self.display_stats.items():
+            if samples:
+                wall = sorted(ms for ms, _ in samples)
+                cpu = sum(c for _, c in samples) / len(samples)
+                print(f"🖼 {kind} scale: {len(wall)} frames | p50 {wall[len(wall) // 2]:.1f}ms "
+                      f"| max {wall[-1]:.1f}ms | avg CPU {cpu:.1f}ms")
+
+    def poll_previews(self):
+        """Shows the newest diffusion preview for the playing track (runs on the Tk thread)."""
+        if not self.running:
+            return
+        frame = self.preview_channel.get_nowait()
+        if frame and frame[0] == self.pipeline.current_track_id:
+            self.update_image_display(frame[1], preview=True)
+        self.root.after(PREVIEW_POLL_MS, self.poll_previews)
+
+    def update_image_display(self, image_path_or_url, is_url=False, preview=False):
         """
-        Calculates optimal generation dimensions based on screen aspect ratio.
-        Stable Diffusion works best around 512-1024px.
-        We scale the resolution down to keep the ratio but save GPU time.
+        Makes the image current. Previews arrive on the Tk thread every few steps
+        and are replaced soon, so they take the fast bilinear path only.
         """
-        screen_ratio = self.screen_width / self.screen_height
-        
-        # Base size for the long edge (Higher = sharper but slower)
-        # 1024 is a good balance for modern SD models.
-        long_edge = 1024 
-
-        if screen_ratio > 1: # Landscape
-            width = long_edge
-            height = int(long_edge / screen_ratio)
-        else: # Portrait
-            height = long_edge
-            width = int(long_edge * screen_ratio)
-
-        # Dimensions must be multiples of 8 for Stable Diffusion
-        width = (width // 8) * 8
-        height = (height // 8) * 8
-        
-        print(f"📏 Screen: {self.screen_width}x{self.screen_height} | Generating at: {width}x{height} (Ratio Preserved)")
-        return width, height
-
-    def update_image_display(self, image_path_or_url, is_url=False):
+        hq = not preview
         try:
-            if image_path_or_url is None:
-                self.current_image_pil = Image.new('RGB', (self.screen_width, self.screen_height), "#000000")
+            if isinstance(image_path_or_url, Image.Image):
+                image = image_path_or_url
+            elif image_path_or_url is None:
+                image = Image.new('RGB', (self.screen_width, self.screen_height), "#000000")
             elif is_url:
                 response = requests.get(image_path_or_url, timeout=5)
-                self.current_image_pil = Image.open(BytesIO(response.content))
+                image = Image.open(BytesIO(response.content)).convert('RGB')
             else:
-                self.current_image_pil = Image.open(image_path_or_url)
-            
-            # Apply dark overlay for text readability
-            overlay = Image.new('RGBA', self.current_image_pil.size, (0,0,0,80))
-            self.current_image_pil = Image.alpha_composite(self.current_image_pil.convert('RGBA'), overlay).convert('RGB')
+                image = Image.open(image_path_or_url).convert('RGB')
+
+            with self.scale_lock:
+                self.current_image_pil = image
+                self.image_version += 1
 
-            self.root.after(0, self.on_resize)
+            # Scale + darken once here (usually off the Tk thread); showing it is then a cache hit
+            with tracer.span("display"):
+                self.scaled_frame(hq=hq)
+            self.root.after(0, lambda: self.show_current(hq=hq))
         except Exception as e:
             print(f"Image load error: {e}")
 
@@ -168,85 +264,50 @@ class SpotifyAIApp:
         self.canvas.itemconfig(self.artist_item, text=artist)
         self.canvas.itemconfig(self.artist_shadow, text=artist)
 
+    def tick_lyrics(self):
+        """Advances the lyric line from the last poll plus elapsed time (Tk thread)."""
+        if not self.running:
+            return
+        track = self.pipeline.last_poll
+        if track:
+            progress = track.get('progress_ms', 0)
+            if track.get('is_playing') and track.get('polled_at'):
+                progress += (time.time() - track['polled_at']) * 1000
+            self.update_lyric_line(progress)
+        self.root.after(LYRIC_TICK_MS, self.tick_lyrics)
+
+    def update_lyric_line(self, progress_ms):
+        # One binary search per tick; the canvas is only touched when the line changes
+        timeline = self.pipeline.current_timeline
+        line = timeline.line_at(progress_ms) if timeline else ""
+        if line != self.current_line:
+            self.current_line = line
+            self.root.after(0, lambda: self._update_lyric_text(line))
+
+    def _update_lyric_text(self, line):
+        self.canvas.itemconfig(self.lyric_item, text=line)
+        self.canvas.itemconfig(self.lyric_shadow, text=line)
+
+    def set_playing(self, is_playing):
+        """Play state from the last poll (pipeline thread)."""
+        self.is_playing = is_playing
+        self.root.after(0, self._update_play_icon)
+
     def _update_play_icon(self):
         icon = "⏸" if self.is_playing else "▶"
         self.canvas.itemconfig(self.play_btn, text=icon)
 
-    # --- MAIN LOOP ---
-    def main_loop(self):
-        last_track_id = None
-        while self.running:
-            try:
-                current = self.spotify.get_current_track()
-                if not current:
-                    time.sleep(2)
-                    continue
-
-                self.is_playing = current.get('is_playing', False)
-                self.root.after(0, self._update_play_icon)
-
-                if current['id'] != last_track_id:
-                    last_track_id = current['id']
-                    self.handle_track_change(current)
-                
-                time.sleep(1)
-            except Exception as e:
-                print(f"Loop error: {e}")
-                time.sleep(5)
-
-    def handle_track_change(self, track):
-        self.update_info(track['title'], track['artist'])
-        
-        # 1. Show Official Album Art first (Instant feedback)
-        if track.get('album_art'):
-            self.update_image_display(track['album_art'], is_url=True)
-
-        # 2. Check if AI Art exists
-        output_path = f"art_output/{track['id']}.png"
-        if os.path.exists(output_path):
-            self.update_image_display(output_path)
-            return
-
-        # 3. Generate New Art
-        self.generate_new_art(track, output_path)
-
-    def generate_new_art(self, track, output_path):
-        # Fetch Lyrics (simplified)
-        try:
-            lyrics = self.lyrics_engine.get_lyrics_for_queue(track, []).get("current", "")
-        except: lyrics = ""
-        
-        if not lyrics: 
-            genres = track.get("genres", [])
-            lyrics = f"{track['title']} {' '.join(genres) if genres else ''}"
-
-        # Get Prompt
-        prompt, _, _ = self.translator.create_smart_prompt(track["title"], track["artist"], lyrics, track.get("genres", []))
-
-        # --- DYNAMIC RESOLUTION ---
-        gen_w, gen_h = self.calculate_generation_dims()
-
-        try:
-            self.generator.generate_image(
-                prompt,
-                track['id'],
-                album_art_url=track.get("album_art"),
-                width=gen_w, 
-                height=gen_h
-            )
-            self.update_image_display(output_path)
-        except Exception as e:
-            print(f"Generation Failed: {e}")
-
     # --- Controls ---
     def toggle_play(self):
-        if self.is_playing: self.spotify.pause_playback()
-        else: self.spotify.start_playback()
+        self.pipeline.toggle_play(self.is_playing)
         self.is_playing = not self.is_playing
         self._update_play_icon()
-    
-    def next_track(self): self.spotify.next_track()
-    def prev_track(self): self.spotify.previous_track()
+
+    def next_track(self):
+        self.pipeline.next_track()
+
+    def prev_track(self):
+        self.pipeline.prev_track()
 
 if __name__ == "__main__":
     os.makedirs("art_output", exist_ok=True)
@@ -3,45 +3,302 @@ from diffusers import StableDiffusionImg2ImgPipeline, DEISMultistepScheduler
 from PIL import Image, ImageFilter
 import requests
 from io import BytesIO
-import os
+import time
+import zlib
+
+from job_control import check
+from init_image_cache import InitImageCache
+from render_profiles import load_profile
+from art_store import ArtStore
+from tracing import tracer
+
+MODEL_ID = "Lykon/dreamshaper-8"
+
+# Heavy blur on the album art: only its colors should survive into the init image
+BLUR_RADIUS = 50
+# The blur is computed at 1/BLUR_DOWNSCALE resolution and upsampled; at this radius
+# the result is visually identical and far cheaper
+BLUR_DOWNSCALE = 4
+
+NEGATIVE_PROMPT = "text, watermark, ugly, deformed, bad anatomy, blurry, low quality, cartoon, sketch, amateur, grain, disfigured"
+# Upper bound for generate_batch; lowered automatically after an out-of-memory error
+MAX_BATCH = 4
+
+# Linear map from SD 1.x latent channels to RGB. Close enough for a preview
+# and orders of magnitude cheaper than a VAE decode.
+LATENT_RGB_FACTORS = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+
+def latents_to_preview(latents):
+    """(1, 4, h/8, w/8) latents -> small RGB PIL image at latent resolution."""
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=latents.dtype, device=latents.device)
+    rgb = torch.einsum("chw,cr->hwr", latents[0], factors)
+    rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).byte().cpu().numpy()
+    return Image.fromarray(rgb)
 
 class ImageGenerator:
-    def __init__(self):
-        print("DEBUG: Loading DreamShaper 8 (High Quality Model)...")
-        self.pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
-            "Lykon/dreamshaper-8",
-            torch_dtype=torch.float16,
-            variant="fp16"
-        ).to("cuda")
+    def __init__(self, preview_channel=None, preview_every=0, init_cache=None, cache_latents=True, profile=None,
+                 art_store=None, pipe=None):
+        # Progressive mode: every `preview_every` steps a cheap preview goes to preview_channel
+        self.preview_channel = preview_channel
+        self.preview_every = preview_every
+        self.preview_stats = {"count": 0, "total_s": 0.0}
+        # Same album -> same blurred init image and VAE latents
+        self.init_cache = init_cache or InitImageCache()
+        self.cache_latents = cache_latents
+        self.max_batch = MAX_BATCH
+        # Steps actually run and their wall time for the last render, for the cost model
+        self.last_timing = None
+        self.art_store = art_store or ArtStore()
+
+        # Device, dtype and memory options (see render_profiles.PROFILES)
+        if profile is None or isinstance(profile, str):
+            profile = load_profile(profile, cuda_available=torch.cuda.is_available())
+        self.profile = profile
+        self.device = profile["device"]
+        self.steps = profile["steps"]
+        dtype = getattr(torch, profile["dtype"])
+
+        if self.device == "cpu" and profile["threads"]:
+            torch.set_num_threads(profile["threads"])
+
+        if pipe is not None:
+            # A ready pipeline (e.g. the tiny random one in benchmarks/offline_fakes.py)
+            self.pipe = pipe.to(dtype=dtype)
+        else:
+            print(f"DEBUG: Loading DreamShaper 8 (High Quality Model) | profile={profile['name']} {self.device}/{profile['dtype']}...")
+            self.pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
+                MODEL_ID,
+                torch_dtype=dtype,
+                # Half-precision weights only when they are used as such, not upcast after loading
+                variant="fp16" if dtype == torch.float16 else None,
+                low_cpu_mem_usage=True
+            )
+        if profile["low_memory"] and self.device == "cuda":
+            # Keeps only the active sub-model on the GPU
+            self.pipe.enable_model_cpu_offload()
+        else:
+            self.pipe = self.pipe.to(self.device)
         
         self.pipe.scheduler = DEISMultistepScheduler.from_config(self.pipe.scheduler.config)
         self.pipe.safety_checker = None
         self.pipe.requires_safety_checker = False
 
-    def generate_image(self, smart_prompt, track_id, album_art_url=None, width=512, height=512):
-        try:
-            response = requests.get(album_art_url, timeout=5)
-            init_image = Image.open(BytesIO(response.content)).convert("RGB")
-        except:
-            init_image = Image.new('RGB', (width, height), color='black')
+        if profile["channels_last"]:
+            self.pipe.unet.to(memory_format=torch.channels_last)
+        if profile["attention_slicing"]:
+            # "max": one attention head at a time, the lowest peak memory at some speed cost
+            self.pipe.enable_attention_slicing("max" if profile["low_memory"] else "auto")
+        if profile["low_memory"]:
+            # Decode batch images one by one and never batch the UNet either
+            self.pipe.enable_vae_slicing()
+            self.max_batch = 1
+        if profile["vae_tiling"]:
+            self.pipe.enable_vae_tiling()
+        if profile["compile"]:
+            self.pipe.unet = torch.compile(self.pipe.unet)
 
-        # Heavy Blur = Creative Freedom
-        # We give Llama's prompt the power to shape the image, using only the *colors* of the original album.
-        init_image = init_image.resize((width, height)).filter(ImageFilter.GaussianBlur(50))
+    def generate_image(self, smart_prompt, track_id, album_art_url=None, width=512, height=512,
+                       cancel_token=None, steps=None, strength=0.85):
+        with tracer.span("init_image"):
+            init_image = self._prepare_init(album_art_url, width, height)
 
+        check(cancel_token)
         print(f"DEBUG: Generating {width}x{height} | Prompt: {smart_prompt[:50]}...")
+        # High strength to follow the Llama prompt closely
+        image = self._run_pipe(smart_prompt, track_id, init_image, width, height, steps, strength, cancel_token)
+
+        self._store(track_id, image, smart_prompt)
+        if self.preview_stats["count"]:
+            print(f"DEBUG: Preview overhead {self.preview_overhead_ms():.1f}ms/frame")
+        return image
+
+    def refine_image(self, smart_prompt, track_id, width, height, strength=0.3, cancel_token=None):
+        """Upscale pass: the existing art, resized to width x height, re-diffused at low strength."""
+        path = self.art_store.master_path(track_id)
+        init_image = Image.open(path).convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+
+        check(cancel_token)
+        print(f"DEBUG: Refining to {width}x{height}...")
+        image = self._run_pipe(smart_prompt, track_id, init_image, width, height, None, strength, cancel_token)
+        self._store(track_id, image, smart_prompt)
+        return image
+
+    def _store(self, track_id, image, prompt, seed=None, timing=None):
+        with tracer.span("art_save"):
+            self.art_store.save_master(
+                track_id, image, prompt=prompt, model=MODEL_ID,
+                seed=self.job_seed({"track_id": track_id}) if seed is None else seed,
+                timings=self.last_timing if timing is None else timing
+            )
+
+    def _run_pipe(self, smart_prompt, track_id, init_image, width, height, steps, strength, cancel_token):
+        steps = steps or self.steps
+        # Seeded per track, so the art store's seed reproduces the image
+        generator = torch.Generator(device=self.device).manual_seed(self.job_seed({"track_id": track_id}))
+        timing = {"steps": 0, "width": width, "height": height, "seconds": 0.0}
+        start = time.perf_counter()
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            timing["steps"] += 1
+            timing["seconds"] = time.perf_counter() - start
+            # Raising JobCancelled here aborts the denoising loop at this step
+            check(cancel_token)
+            if self.preview_channel and self.preview_every and (step + 1) % self.preview_every == 0:
+                self._push_preview(track_id, callback_kwargs["latents"])
+            return callback_kwargs
         
-        with torch.inference_mode():
+        with tracer.span("diffusion"), torch.inference_mode():
             image = self.pipe(
                 prompt=smart_prompt,
-                negative_prompt="text, watermark, ugly, deformed, bad anatomy, blurry, low quality, cartoon, sketch, amateur, grain, disfigured",
+                negative_prompt=NEGATIVE_PROMPT,
                 image=init_image,
-                strength=0.85, # High strength to follow the Llama prompt closely
+                strength=strength,
                 guidance_scale=7.5, 
                 width=width,
                 height=height,
-                num_inference_steps=30
+                num_inference_steps=steps,
+                generator=generator,
+                callback_on_step_end=on_step_end
             ).images[0]
 
-        os.makedirs("art_output", exist_ok=True)
-        image.save(f"art_output/{track_id}.png")
\ No newline at end of file
+        self.last_timing = timing
+        if timing["seconds"]:
+            tracer.gauge("diffusion_steps_per_second", round(timing["steps"] / timing["seconds"], 3))
+        return image
+
+    def generate_batch(self, jobs, cancel_token=None, steps=None):
+        """
+        Renders many tracks with as few pipeline calls as possible.
+        jobs: dicts with prompt, track_id, album_art_url, width, height and optional seed.
+        steps overrides the profile's step count for every job.
+        Jobs sharing a resolution run together, up to self.max_batch per call.
+        Every image gets its own seeded generator, so each one can be reproduced alone.
+        Returns images per minute.
+        """
+        groups = {}
+        for job in jobs:
+            groups.setdefault((job["width"], job["height"]), []).append(job)
+
+        start = time.perf_counter()
+        done = 0
+        for (width, height), group in groups.items():
+            i = 0
+            while i < len(group):
+                check(cancel_token)
+                chunk = group[i:i + self.max_batch]
+                try:
+                    self._render_chunk(chunk, width, height, cancel_token, steps)
+                except (torch.cuda.OutOfMemoryError, MemoryError):
+                    if len(chunk) == 1:
+                        raise
+                    # Memory-aware fallback: retry this chunk (and all later ones) smaller
+                    self.max_batch = max(len(chunk) // 2, 1)
+                    if self.device == "cuda":
+                        torch.cuda.empty_cache()
+                    print(f"DEBUG: Out of memory, batch size lowered to {self.max_batch}")
+                    continue
+                i += len(chunk)
+                done += len(chunk)
+
+        elapsed = time.perf_counter() - start
+        per_min = 60 * done / elapsed if elapsed else 0.0
+        print(f"DEBUG: Batch rendered {done} images in {elapsed:.1f}s ({per_min:.1f} images/min)")
+        return per_min
+
+    def _render_chunk(self, chunk, width, height, cancel_token, steps=None):
+        inits = [self._prepare_init(job.get("album_art_url"), width, height) for job in chunk]
+        if self.cache_latents:
+            # A failed download comes back as an image; encode it so the batch is uniform
+            inits = [
+                self._encode(init, width, height).to(self.device, dtype=self.pipe.vae.dtype)
+                if isinstance(init, Image.Image) else init
+                for init in inits
+            ]
+            inits = torch.cat(inits)
+
+        generators = [
+            torch.Generator(device=self.device).manual_seed(self.job_seed(job)) for job in chunk
+        ]
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            check(cancel_token)
+            return callback_kwargs
+
+        print(f"DEBUG: Generating batch of {len(chunk)} at {width}x{height}")
+        with torch.inference_mode():
+            images = self.pipe(
+                prompt=[job["prompt"] for job in chunk],
+                negative_prompt=[NEGATIVE_PROMPT] * len(chunk),
+                image=inits,
+                strength=0.85,
+                guidance_scale=7.5,
+                width=width,
+                height=height,
+                num_inference_steps=steps or self.steps,
+                generator=generators,
+                callback_on_step_end=on_step_end
+            ).images
+
+        for job, image in zip(chunk, images):
+            self._store(job["track_id"], image, job["prompt"], seed=self.job_seed(job), timing={})
+
+    def job_seed(self, job):
+        """Explicit seed, or a stable one derived from the track id."""
+        if job.get("seed") is not None:
+            return job["seed"]
+        return zlib.crc32(job["track_id"].encode("utf-8"))
+
+    def _prepare_init(self, album_art_url, width, height):
+        """Blurred init image, or its cached VAE latents when cache_latents is on."""
+        key = self.init_cache.key(album_art_url, width, height, BLUR_RADIUS)
+        entry = self.init_cache.get(key)
+        if entry is None:
+            try:
+                response = requests.get(album_art_url, timeout=5)
+                init_image = Image.open(BytesIO(response.content)).convert("RGB")
+            except:
+                # Not cached: the download may work next time
+                return self._blur(Image.new('RGB', (width, height), color='black'), width, height)
+            entry = self.init_cache.put(key, self._blur(init_image, width, height))
+            tracer.count("cache", stage="init_image", result="miss")
+        else:
+            print("DEBUG: Init image cache hit")
+            tracer.count("cache", stage="init_image", result="hit")
+
+        if not self.cache_latents:
+            return entry["image"]
+        if entry["latents"] is None:
+            self.init_cache.set_latents(key, self._encode(entry["image"], width, height))
+            entry = self.init_cache.get(key)
+        return entry["latents"].to(self.device, dtype=self.pipe.vae.dtype)
+
+    def _blur(self, image, width, height):
+        # Heavy Blur = Creative Freedom
+        # We give Llama's prompt the power to shape the image, using only the *colors* of the original album.
+        small = (max(width // BLUR_DOWNSCALE, 1), max(height // BLUR_DOWNSCALE, 1))
+        blurred = image.resize(small).filter(ImageFilter.GaussianBlur(BLUR_RADIUS / BLUR_DOWNSCALE))
+        return blurred.resize((width, height), Image.Resampling.BILINEAR)
+
+    def _encode(self, image, width, height):
+        """VAE-encodes the init image once; img2img accepts these latents in place of the image."""
+        with torch.inference_mode():
+            tensor = self.pipe.image_processor.preprocess(image, height=height, width=width)
+            tensor = tensor.to(self.device, dtype=self.pipe.vae.dtype)
+            latents = self.pipe.vae.encode(tensor).latent_dist.mode()
+            return latents * self.pipe.vae.config.scaling_factor
+
+    def _push_preview(self, track_id, latents):
+        start = time.perf_counter()
+        self.preview_channel.put(track_id, latents_to_preview(latents))
+        self.preview_stats["count"] += 1
+        self.preview_stats["total_s"] += time.perf_counter() - start
+
+    def preview_overhead_ms(self):
+        """Average cost of one preview frame, to tune preview_every."""
+        count = self.preview_stats["count"]
+        return 1000 * self.preview_stats["total_s"] / count if count else 0.0
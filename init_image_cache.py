@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import torch
+from PIL import Image
+
+CACHE_DIR = "init_cache"
+MEMORY_ENTRIES = 16
+# Disk tier limits; least recently used albums go first (recency = .png mtime)
+DISK_ENTRIES = 256
+DISK_MAX_BYTES = 256 * 1024 * 1024
+
+class InitImageCache:
+    """
+    Blurred album-art init images (and optionally their VAE latents), keyed by
+    (album art URL, width, height, blur radius). Tracks from the same album hit
+    the same entry, so download, blur and VAE encode happen once per album.
+    """
+    def __init__(self, max_entries=MEMORY_ENTRIES, disk_dir=CACHE_DIR, disk_entries=DISK_ENTRIES,
+                 disk_max_bytes=DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_entries = disk_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()  # key -> {"image": PIL.Image, "latents": Tensor | None}
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, url, width, height, blur_radius):
+        raw = f"{url}|{width}x{height}|{blur_radius}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+
+        entry = self._load_disk(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, image, latents=None):
+        entry = {"image": image, "latents": latents}
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                image.save(self._path(key, ".png"))
+                if latents is not None:
+                    torch.save(latents.detach().cpu(), self._path(key, ".pt"))
+            except Exception as e:
+                print(f"Init cache write error: {e}")
+            self._evict_disk()
+        return entry
+
+    def set_latents(self, key, latents):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return
+            entry["latents"] = latents
+        if self.disk_dir:
+            try:
+                torch.save(latents.detach().cpu(), self._path(key, ".pt"))
+            except Exception as e:
+                print(f"Init cache write error: {e}")
+            self._evict_disk()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, key, ext):
+        return os.path.join(self.disk_dir, key + ext)
+
+    def _evict_disk(self):
+        """Drops whole entries (.png + .pt), oldest first, past disk_entries or disk_max_bytes."""
+        with self._lock:
+            entries = {}  # key -> [last used, bytes]
+            try:
+                names = os.listdir(self.disk_dir)
+            except OSError:
+                return
+            for name in names:
+                key, ext = os.path.splitext(name)
+                try:
+                    st = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entry = entries.setdefault(key, [0.0, 0])
+                entry[1] += st.st_size
+                if ext == ".png":
+                    entry[0] = st.st_mtime
+            total = sum(size for _, size in entries.values())
+            for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+                if len(entries) <= self.disk_entries and total <= self.disk_max_bytes:
+                    break
+                for ext in (".png", ".pt"):
+                    try:
+                        os.remove(self._path(key, ext))
+                    except OSError:
+                        pass
+                del entries[key]
+                total -= size
+
+    def _load_disk(self, key):
+        if not self.disk_dir or not os.path.exists(self._path(key, ".png")):
+            return None
+        try:
+            os.utime(self._path(key, ".png"), (time.time(), time.time()))  # mark as recently used
+            image = Image.open(self._path(key, ".png")).convert("RGB")
+            latents = None
+            if os.path.exists(self._path(key, ".pt")):
+                latents = torch.load(self._path(key, ".pt"))
+            return {"image": image, "latents": latents}
+        except Exception as e:
+            print(f"Init cache read error: {e}")
+            return None
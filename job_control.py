@@ -0,0 +1,28 @@
+import threading
+
+class JobCancelled(Exception):
+    """Raised inside a render job once a newer job has superseded it."""
+
+class CancelToken:
+    """
+    Shared flag between the scheduler and a running job. The job calls check()
+    between stages (and per diffusion step) so a skip frees the worker quickly.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+def check(token):
+    """token.check() that tolerates token=None, for code paths used outside the scheduler."""
+    if token is not None:
+        token.check()
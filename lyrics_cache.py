@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DB_FILE = "lyrics_cache.db"
+LEGACY_JSON_FILE = "lyrics_cache.json"
+
+# Tracks with no lyrics found are retried after this long instead of never
+NEGATIVE_TTL = 7 * 24 * 3600
+MEMORY_ENTRIES = 512
+FLUSH_EVERY = 20       # pending writes
+FLUSH_INTERVAL = 30.0  # seconds
+
+class SQLiteBackend:
+    """Indexed on-disk store: one row per track id, O(1) lookups and inserts."""
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS lyrics ("
+            "track_id TEXT PRIMARY KEY, lyrics TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def load(self, track_id):
+        row = self.conn.execute(
+            "SELECT lyrics, fetched_at FROM lyrics WHERE track_id = ?", (track_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def write_many(self, items):
+        """items: iterable of (track_id, lyrics, fetched_at)."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO lyrics (track_id, lyrics, fetched_at) VALUES (?, ?, ?)",
+            items,
+        )
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+class LyricsCache:
+    """
+    Bounded LRU in front of a persistent backend. Writes are batched and
+    flushed every FLUSH_EVERY entries or FLUSH_INTERVAL seconds.
+    Empty lyrics are negative entries and expire after NEGATIVE_TTL.
+    """
+    def __init__(self, backend=None, max_entries=MEMORY_ENTRIES, negative_ttl=NEGATIVE_TTL):
+        self.backend = backend or SQLiteBackend()
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+
+        self._memory = OrderedDict()  # track_id -> (lyrics, fetched_at)
+        self._dirty = {}
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+
+    def get(self, track_id):
+        """Returns cached lyrics ("" for a known miss) or None if the track must be fetched."""
+        with self._lock:
+            entry = self._memory.get(track_id)
+            if entry is not None:
+                self._memory.move_to_end(track_id)
+            else:
+                entry = self._dirty.get(track_id) or self.backend.load(track_id)
+                if entry is None:
+                    return None
+                self._remember(track_id, entry)
+
+        lyrics, fetched_at = entry
+        if not lyrics and time.time() - fetched_at > self.negative_ttl:
+            return None
+        return lyrics
+
+    def put(self, track_id, lyrics):
+        entry = (lyrics or "", time.time())
+        with self._lock:
+            self._remember(track_id, entry)
+            self._dirty[track_id] = entry
+            if len(self._dirty) >= FLUSH_EVERY or time.time() - self._last_flush > FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self.backend.write_many((k, v[0], v[1]) for k, v in self._dirty.items())
+                self._dirty.clear()
+            self._last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+    def _remember(self, track_id, entry):
+        self._memory[track_id] = entry
+        self._memory.move_to_end(track_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+def migrate_json_cache(backend, json_path=LEGACY_JSON_FILE):
+    """One-time import of the old whole-file JSON cache. The JSON file is renamed afterwards."""
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except Exception as e:
+        print(f"Lyrics cache migration skipped: {e}")
+        return 0
+
+    # Old misses were stored as "" forever; give them a timestamp of 0 so they retry
+    now = time.time()
+    backend.write_many(
+        (t_id, lyrics or "", now if lyrics else 0.0) for t_id, lyrics in legacy.items()
+    )
+    os.replace(json_path, json_path + ".migrated")
+    print(f"📦 Migrated {len(legacy)} lyrics from {json_path}")
+    return len(legacy)
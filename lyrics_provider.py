@@ -1,64 +1,124 @@
-import os
-import re
+import atexit
+import threading
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
-CACHE_FILE = "lyrics_cache.json"
+from lyrics_cache import LyricsCache, SQLiteBackend, migrate_json_cache
+from lyrics_sources import default_providers, hedged_fetch
+from synced_lyrics import LyricsTimeline, plain_lyrics
+from tracing import tracer
+
+MAX_WORKERS = 4
+HEDGE_DELAY = 0.5  # seconds before the next provider is raced against a slow one
+BATCH_DEADLINE = 8.0  # seconds for a whole get_lyrics_for_queue call
 
 class FreeLyricsHandler:
-    def __init__(self):
-        # Persistent cache
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                self.cache = json.load(f)
-        except:
-            self.cache = {}
+    def __init__(self, cache=None, providers=None):
+        # Persistent cache (indexed, write-batched)
+        if cache is None:
+            backend = SQLiteBackend()
+            migrate_json_cache(backend)
+            cache = LyricsCache(backend)
+        self.cache = cache
+        self.providers = providers or default_providers()
+        atexit.register(self.save_cache)
 
-    def save_cache(self):
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.cache, f, ensure_ascii=False, indent=2)
+        # Separate pool for provider races so they never wait behind their own parent job.
+        # Only its threads make HTTP requests, so the connection pool is sized to match.
+        provider_workers = MAX_WORKERS * len(self.providers)
+        self.pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="lyrics")
+        self.provider_pool = ThreadPoolExecutor(max_workers=provider_workers, thread_name_prefix="lyrics-src")
+
+        # Shared keep-alive connections instead of a fresh requests.get per lookup
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=provider_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-    def _clean(self, s):
-        """Clean artist/title strings for safe URLs."""
-        return re.sub(r"[^\w\s\-']", "", s).strip()
+        # track_id -> Future, so concurrent callers share one request per track
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
 
-    def _try_lyrics_ovh(self, title, artist):
-        """Fetch lyrics from Lyrics.ovh."""
+    def save_cache(self):
+        """Writes any batched cache entries to disk."""
         try:
-            artist_clean = self._clean(artist).replace(" ", "%20")
-            title_clean = self._clean(title).replace(" ", "%20")
-            url = f"https://api.lyrics.ovh/v1/{artist_clean}/{title_clean}"
-            r = requests.get(url, timeout=4)
-            if r.status_code == 200:
-                return r.json().get("lyrics", "")
-            return ""
-        except:
-            return ""
+            self.cache.flush()
+        except Exception as e:
+            print(f"Lyrics cache flush error: {e}")
+
+    def _fetch_raw(self, track):
+        """Lyrics as stored: LRC text when a provider had synced lyrics, plain otherwise."""
+        t_id = track.get("id", "unknown")
+        cached = self.cache.get(t_id)
+        if cached is not None:
+            tracer.count("cache", stage="lyrics", result="hit")
+            return cached
+        tracer.count("cache", stage="lyrics", result="miss")
+
+        lyrics, missing = "", True
+        if track.get("title") and track.get("artist"):
+            with tracer.span("lyrics_fetch"):
+                lyrics, provider, missing = hedged_fetch(
+                    self.providers, track, self.session, self.provider_pool, hedge_delay=HEDGE_DELAY
+                )
+            if provider:
+                print(f"🎤 Lyrics for '{track['title']}' from {provider}")
+
+        if lyrics or missing:
+            self.cache.put(t_id, lyrics)
+        else:
+            # Every source failed or timed out: no negative entry, the next lookup retries
+            print(f"Lyrics for '{track.get('title', t_id)}' unavailable right now, not caching the miss")
+        return lyrics
 
     def _fetch_single(self, track):
+        return track.get("id", "unknown"), plain_lyrics(self._fetch_raw(track))
+
+    def get_timeline(self, track_id):
+        """LyricsTimeline for an already fetched track, or None if it has no synced lyrics."""
+        cached = self.cache.get(track_id)
+        return LyricsTimeline.from_lrc(cached) if cached else None
+
+    def fetch_async(self, track):
+        """Returns a Future for (track_id, lyrics). Requests for the same track are coalesced."""
         t_id = track.get("id", "unknown")
-        if t_id in self.cache:
-            return t_id, self.cache[t_id]
+        cached = self.cache.get(t_id)
+        if cached is not None:
+            done = Future()
+            done.set_result((t_id, plain_lyrics(cached)))
+            return done
 
-        title = track.get("title", "")
-        artist = track.get("artist", "")
-        lyrics = ""
+        with self._inflight_lock:
+            fut = self._inflight.get(t_id)
+            if fut is not None:
+                return fut
+            fut = self.pool.submit(self._fetch_single, track)
+            self._inflight[t_id] = fut
 
-        if title and artist:
-            lyrics = self._try_lyrics_ovh(title, artist)
+        def _forget(f, t_id=t_id):
+            with self._inflight_lock:
+                if self._inflight.get(t_id) is f:
+                    del self._inflight[t_id]
 
-        self.cache[t_id] = lyrics
-        self.save_cache()
-        return t_id, lyrics
+        fut.add_done_callback(_forget)
+        return fut
 
-    def get_lyrics_for_queue(self, current_track, upcoming_queue=None):
+    def get_lyrics_for_queue(self, current_track, upcoming_queue=None, deadline=BATCH_DEADLINE):
         results = {"current": "", "queue": {}}
         all_tracks = []
         if current_track: all_tracks.append(current_track)
         if upcoming_queue: all_tracks.extend(upcoming_queue)
 
-        for track in all_tracks:
-            t_id, text = self._fetch_single(track)
+        futures = [(track, self.fetch_async(track)) for track in all_tracks]
+        wait([f for _, f in futures], timeout=deadline)
+
+        for track, fut in futures:
+            # Anything past the deadline keeps running and lands in the cache for next time
+            if fut.done() and not fut.exception():
+                t_id, text = fut.result()
+            else:
+                t_id, text = track.get("id", "unknown"), ""
             if current_track and t_id == current_track["id"]:
                 results["current"] = text
             else:
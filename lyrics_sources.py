@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+
+# Overridable so a local stand-in server can be used for offline runs
+LYRICS_OVH_URL = os.getenv("LYRICS_OVH_URL", "https://api.lyrics.ovh/v1")
+LRCLIB_URL = os.getenv("LRCLIB_URL", "https://lrclib.net/api")
+LYRICS_DIR = os.getenv("LYRICS_DIR", "lyrics")
+
+def clean(s):
+    """Clean artist/title strings for safe URLs."""
+    return re.sub(r"[^\w\s\-']", "", s).strip()
+
+class LyricsProvider:
+    """
+    One lyrics source. fetch() returns lyrics text (LRC if time-synced) or ""
+    when the source has none; errors (network, server) are raised instead.
+    `cancelled` is set once another provider already answered; providers check
+    it before sending a request and before reading the body.
+    """
+    name = "base"
+    # An empty answer from an authoritative source is worth caching as a miss
+    authoritative = True
+
+    def fetch(self, track, session, cancelled):
+        raise NotImplementedError
+
+class LocalFolderProvider(LyricsProvider):
+    """Looks for '<artist> - <title>.lrc' (preferred) or '.txt' in LYRICS_DIR."""
+    name = "local"
+    authoritative = False  # a file can be dropped in at any time
+
+    def __init__(self, folder=LYRICS_DIR):
+        self.folder = folder
+
+    def fetch(self, track, session, cancelled):
+        if cancelled.is_set():
+            return ""
+        base = f"{clean(track.get('artist', ''))} - {clean(track.get('title', ''))}"
+        for ext in (".lrc", ".txt"):
+            path = os.path.join(self.folder, base + ext)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    return f.read()
+        return ""
+
+class LrclibProvider(LyricsProvider):
+    """LRCLIB: returns synced lyrics when available, plain otherwise."""
+    name = "lrclib"
+
+    def fetch(self, track, session, cancelled):
+        params = {
+            "artist_name": track.get("artist", ""),
+            "track_name": track.get("title", ""),
+        }
+        if track.get("duration_ms"):
+            params["duration"] = round(track["duration_ms"] / 1000)
+        if cancelled.is_set():
+            return ""
+        # stream=True: only the headers are read here, so a lost race skips the body
+        with session.get(f"{LRCLIB_URL}/get", params=params, timeout=4, stream=True) as r:
+            if r.status_code == 404 or cancelled.is_set():
+                return ""
+            r.raise_for_status()
+            data = r.json()
+        return data.get("syncedLyrics") or data.get("plainLyrics") or ""
+
+class LyricsOvhProvider(LyricsProvider):
+    """Fetch lyrics from Lyrics.ovh."""
+    name = "lyrics.ovh"
+
+    def fetch(self, track, session, cancelled):
+        artist_clean = clean(track.get("artist", "")).replace(" ", "%20")
+        title_clean = clean(track.get("title", "")).replace(" ", "%20")
+        if cancelled.is_set():
+            return ""
+        with session.get(f"{LYRICS_OVH_URL}/{artist_clean}/{title_clean}", timeout=4, stream=True) as r:
+            if r.status_code == 404 or cancelled.is_set():
+                return ""
+            r.raise_for_status()
+            return r.json().get("lyrics", "")
+
+def default_providers():
+    # Cheapest first; each later one is a hedge started if the earlier ones are slow
+    return [LocalFolderProvider(), LrclibProvider(), LyricsOvhProvider()]
+
+def hedged_fetch(providers, track, session, pool, hedge_delay=0.5, timeout=6.0):
+    """
+    Starts providers one after another and returns the first non-empty answer
+    as (lyrics, provider name, missing). The next provider starts after
+    hedge_delay, or straight away if every started one came back empty.
+    Providers not started yet are cancelled. `missing` is True only when no
+    lyrics were found and an authoritative provider said so; errors and
+    timeouts alone leave it False, so the caller need not cache a miss.
+    """
+    answered = threading.Event()
+    cond = threading.Condition()
+    result = {"lyrics": "", "provider": None, "missing": False}
+    finished = [0]
+
+    def run(provider):
+        text, failed = "", False
+        if not answered.is_set():
+            try:
+                text = provider.fetch(track, session, answered) or ""
+            except Exception as e:
+                failed = True
+                print(f"Lyrics provider {provider.name} failed: {e}")
+        with cond:
+            if answered.is_set():
+                pass  # lost the race or came back after the deadline
+            elif text.strip():
+                result["lyrics"], result["provider"] = text, provider.name
+                answered.set()
+            elif not failed and provider.authoritative:
+                result["missing"] = True
+            finished[0] += 1
+            cond.notify_all()
+
+    futures = []
+    with cond:
+        for provider in providers:
+            futures.append(pool.submit(run, provider))
+            cond.wait_for(lambda: answered.is_set() or finished[0] >= len(futures), hedge_delay)
+            if answered.is_set():
+                break
+        cond.wait_for(lambda: answered.is_set() or finished[0] >= len(futures), timeout)
+
+        answered.set()  # tells any slow provider still running to give up
+        lyrics, provider, missing = result["lyrics"], result["provider"], result["missing"]
+    for fut in futures:
+        fut.cancel()
+    return lyrics, provider, missing
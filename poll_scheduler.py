@@ -0,0 +1,90 @@
+import time
+import threading
+from collections import deque
+
+# Seconds between polls
+MIN_INTERVAL = 1.0
+MAX_INTERVAL = 10.0     # upper bound mid-song; also bounds how late an external skip is seen
+PAUSED_INTERVAL = 3.0
+IDLE_INTERVAL = 5.0     # nothing playing
+BURST_INTERVAL = 0.5    # right after a control action in our UI
+BURST_WINDOW = 4.0
+# Start dense polling this long before the predicted end of the track
+BOUNDARY_MARGIN = 3.0
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+class PollScheduler:
+    """
+    Decides when main_loop polls Spotify next: rarely mid-song, densely around
+    the predicted track boundary and after a control action, exponential
+    backoff on errors (Retry-After wins on rate limits). Also measures how long
+    track changes took to be noticed.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.wake = threading.Event()
+        self.errors = 0
+        self.burst_until = 0.0
+        self.predicted_end = None   # clock time the current track should end
+        self.nudged_at = None
+        self.latencies = deque(maxlen=100)
+
+    def nudge(self):
+        """A control action (next/prev/play) happened: poll densely and right now."""
+        self.nudged_at = self.clock()
+        self.burst_until = self.nudged_at + BURST_WINDOW
+        self.wake.set()
+
+    def wait(self, delay):
+        """Sleeps up to delay seconds; returns early on nudge()."""
+        self.wake.wait(delay)
+        self.wake.clear()
+
+    def on_error(self, retry_after=None):
+        self.errors += 1
+        if retry_after:
+            return float(retry_after)
+        return min(BACKOFF_BASE * 2 ** (self.errors - 1), BACKOFF_MAX)
+
+    def on_track_change(self):
+        """Records detection latency: from the predicted boundary or the user's action."""
+        now = self.clock()
+        start = None
+        if self.nudged_at is not None and now - self.nudged_at <= BURST_WINDOW:
+            start = self.nudged_at
+        elif self.predicted_end is not None:
+            start = self.predicted_end
+        if start is not None and now >= start:
+            self.latencies.append(now - start)
+        self.nudged_at = None
+
+    def next_delay(self, track):
+        """Seconds to wait after a successful poll that returned `track` (or None)."""
+        self.errors = 0
+        now = self.clock()
+
+        if track is None:
+            self.predicted_end = None
+            return IDLE_INTERVAL
+        if track.get("duration_ms"):
+            remaining = (track["duration_ms"] - track.get("progress_ms", 0)) / 1000
+            self.predicted_end = now + remaining if track.get("is_playing") else None
+        else:
+            remaining = None
+
+        if now < self.burst_until:
+            return BURST_INTERVAL
+        if not track.get("is_playing"):
+            return PAUSED_INTERVAL
+        if remaining is None:
+            return MIN_INTERVAL
+        return max(MIN_INTERVAL, min(MAX_INTERVAL, remaining - BOUNDARY_MARGIN))
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "track_changes": len(latencies),
+            "detect_p50_s": latencies[len(latencies) // 2] if latencies else None,
+            "detect_max_s": latencies[-1] if latencies else None,
+        }
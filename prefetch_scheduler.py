@@ -0,0 +1,142 @@
+import heapq
+import itertools
+import threading
+
+from job_control import CancelToken, JobCancelled
+from tracing import tracer
+
+# Lower number = more urgent. The playing track always beats queued tracks.
+PRIORITY_CURRENT = 0
+PRIORITY_PREFETCH = 10
+
+class PrefetchScheduler:
+    """
+    Runs art generation jobs on a single background worker, most urgent first.
+    A track id is only ever waiting or running once; re-submitting it with a
+    better priority just moves it up the queue. A cancelled run that is still
+    unwinding does not count, so re-submitting its track queues a fresh job. A new PRIORITY_CURRENT job
+    supersedes older ones: the running job is cancelled and pending ones dropped.
+    """
+    def __init__(self, render_fn, on_done=None):
+        self.render_fn = render_fn
+        self.on_done = on_done
+        self.running = True
+
+        self._heap = []
+        self._counter = itertools.count()  # FIFO tie-break for equal priorities
+        self._pending = {}  # track_id -> priority of its live heap entry
+        self._in_progress = None
+        self._in_progress_priority = None
+        self._token = None
+        self._cond = threading.Condition()
+
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, track, priority=PRIORITY_PREFETCH):
+        """Queues a track for rendering. Returns False if it was deduplicated."""
+        t_id = track.get("id")
+        if not t_id:
+            return False
+
+        with self._cond:
+            if t_id == self._in_progress and not self._token.cancelled:
+                # Keep it from being preempted now that it is the one playing
+                self._in_progress_priority = min(self._in_progress_priority, priority)
+                return False
+
+            if priority == PRIORITY_CURRENT:
+                self._supersede(t_id)
+            if self._in_progress is not None and priority < self._in_progress_priority:
+                self._cancel_running()
+
+            if t_id in self._pending and self._pending[t_id] <= priority:
+                return False
+
+            # Older entry for the same id (if any) becomes stale and is skipped on pop
+            self._pending[t_id] = priority
+            heapq.heappush(self._heap, (priority, next(self._counter), track))
+            tracer.gauge("queue_depth", len(self._pending))
+            self._cond.notify()
+            return True
+
+    def drop_prefetch(self):
+        """Forgets every waiting prefetch job (e.g. the queue was reordered)."""
+        with self._cond:
+            self._heap = [e for e in self._heap if e[0] < PRIORITY_PREFETCH]
+            heapq.heapify(self._heap)
+            self._pending = {
+                t_id: p for t_id, p in self._pending.items() if p < PRIORITY_PREFETCH
+            }
+
+    def supersede(self, track_id):
+        """A new track started playing: jobs for previously playing tracks are dropped."""
+        with self._cond:
+            self._supersede(track_id)
+
+    def _supersede(self, track_id):
+        stale = [t for t, p in self._pending.items() if p == PRIORITY_CURRENT and t != track_id]
+        for t in stale:
+            del self._pending[t]
+        if self._in_progress_priority == PRIORITY_CURRENT and self._in_progress != track_id:
+            self._cancel_running()
+
+    def _cancel_running(self):
+        # Whatever the job finished (lyrics, prompt) stays cached, so a later retry resumes there
+        if self._token and not self._token.cancelled:
+            print(f"⏭ Cancelling render of {self._in_progress}")
+            self._token.cancel()
+
+    def is_busy_with(self, track_id):
+        with self._cond:
+            running = track_id == self._in_progress and not self._token.cancelled
+            return running or track_id in self._pending
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            if self._token:
+                self._token.cancel()
+            self._cond.notify_all()
+
+    def _next_job(self):
+        with self._cond:
+            while self.running:
+                while self._heap:
+                    priority, _, track = heapq.heappop(self._heap)
+                    t_id = track["id"]
+                    if self._pending.get(t_id) != priority:
+                        continue  # Superseded by a re-submit or dropped
+                    del self._pending[t_id]
+                    tracer.gauge("queue_depth", len(self._pending))
+                    self._in_progress = t_id
+                    self._in_progress_priority = priority
+                    self._token = CancelToken()
+                    return self._token, track
+                self._cond.wait()
+            return None, None
+
+    def _worker(self):
+        while True:
+            token, track = self._next_job()
+            if track is None:
+                return
+
+            result = None
+            try:
+                with tracer.job(track["id"]), tracer.span("job"):
+                    result = self.render_fn(track, token)
+            except JobCancelled:
+                print(f"⏭ Render of '{track.get('title', track['id'])}' cancelled")
+            except Exception as e:
+                print(f"Prefetch Error ({track.get('title', track['id'])}): {e}")
+            finally:
+                with self._cond:
+                    self._in_progress = None
+                    self._in_progress_priority = None
+                    self._token = None
+
+            if self.on_done and result:
+                try:
+                    self.on_done(track, result)
+                except Exception as e:
+                    print(f"Prefetch callback error: {e}")
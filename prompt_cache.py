@@ -0,0 +1,79 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from tracing import tracer
+
+DB_FILE = "prompt_cache.db"
+MAX_BYTES = 32 * 1024 * 1024  # evict least recently used entries beyond this
+
+def content_key(*parts):
+    """Stable hash of everything that influences an output (inputs, model, options, template version)."""
+    blob = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class PromptCache:
+    """
+    Persistent content-addressed store for translations and LLM pass outputs.
+    Entries are namespaced by stage so each one can be inspected or cleared on its own.
+    """
+    def __init__(self, path=DB_FILE, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON entries (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage, key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (f"{stage}:{key}",)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                tracer.count("cache", stage=stage, result="miss")
+                return None
+            self.hits += 1
+            tracer.count("cache", stage=stage, result="hit")
+            self.conn.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), f"{stage}:{key}")
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, stage, key, value):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self.conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (f"{stage}:{key}",)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, stage, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (f"{stage}:{key}", stage, value, size, time.time()),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
@@ -0,0 +1,114 @@
+import json
+import math
+import threading
+
+COST_FILE = "step_costs.json"
+EWMA_ALPHA = 0.3
+
+# Art should be on screen within this fraction of the time the track has left
+TARGET_FRACTION = 0.25
+# Best first. Lower strength also means fewer denoising steps actually run
+# (img2img runs int(steps * strength)) and stays closer to the album colors.
+QUALITY_LADDER = [
+    {"steps": 30, "strength": 0.85},
+    {"steps": 25, "strength": 0.85},
+    {"steps": 20, "strength": 0.8},
+    {"steps": 15, "strength": 0.75},
+    {"steps": 10, "strength": 0.7},
+]
+MIN_LONG_EDGE = 384
+# Resolution is given up before steps until the long edge would drop below this
+GOOD_LONG_EDGE = 640
+REFINE_STRENGTH = 0.3
+
+class StepCostModel:
+    """
+    Seconds per denoising step per megapixel, learned online per render profile
+    (exponential moving average) and saved to COST_FILE between runs.
+    """
+    def __init__(self, path=COST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.costs = json.load(f)
+        except:
+            self.costs = {}
+
+    def get(self, profile):
+        return self.costs.get(profile["name"], profile["sec_per_mp_step"])
+
+    def observe(self, profile, steps, width, height, seconds):
+        """Feeds one measured render (steps actually run) into the estimate."""
+        if steps <= 0 or seconds <= 0:
+            return
+        sample = seconds / (steps * width * height / 1e6)
+        with self._lock:
+            old = self.costs.get(profile["name"])
+            self.costs[profile["name"]] = sample if old is None else old + EWMA_ALPHA * (sample - old)
+            self.save()
+
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.costs, f, indent=2)
+        except Exception as e:
+            print(f"Step cost save error: {e}")
+
+def remaining_ms(track, now):
+    """Playback time left, advanced by how long ago the track was polled."""
+    duration = track.get("duration_ms") or 0
+    progress = track.get("progress_ms") or 0
+    if track.get("is_playing") and track.get("polled_at"):
+        progress += (now - track["polled_at"]) * 1000
+    return max(duration - progress, 0)
+
+class QualityScheduler:
+    """Picks steps, strength and resolution so the art lands within the track's deadline."""
+    def __init__(self, profile, cost_model=None, target_fraction=TARGET_FRACTION):
+        self.profile = profile
+        self.cost_model = cost_model or StepCostModel()
+        self.target_fraction = target_fraction
+
+    def _fit_long_edge(self, budget_s, effective_steps, ratio):
+        cost = self.cost_model.get(self.profile)
+        megapixels = budget_s / (effective_steps * cost)
+        fitting = int(math.sqrt(megapixels * 1e6 * ratio) // 64) * 64
+        return min(self.profile["long_edge"], fitting)
+
+    def plan(self, remaining_s, ratio):
+        """
+        ratio: long edge / short edge of the target image.
+        Returns a dict with steps, strength, long_edge, estimate_s and refine
+        (True when a quick render now plus an upscale pass later both fit).
+        """
+        budget_s = max(remaining_s * self.target_fraction, 1.0)
+        cost = self.cost_model.get(self.profile)
+        max_steps = self.profile["steps"]
+
+        chosen = None
+        for rung in QUALITY_LADDER:
+            steps = min(rung["steps"], max_steps)
+            effective = max(int(steps * rung["strength"]), 1)
+            long_edge = self._fit_long_edge(budget_s, effective, ratio)
+            if long_edge >= min(GOOD_LONG_EDGE, self.profile["long_edge"]):
+                chosen = dict(rung, steps=steps, long_edge=long_edge)
+                break
+        if chosen is None:
+            rung = QUALITY_LADDER[-1]
+            steps = min(rung["steps"], max_steps)
+            effective = max(int(steps * rung["strength"]), 1)
+            long_edge = max(MIN_LONG_EDGE, self._fit_long_edge(budget_s, effective, ratio))
+            chosen = dict(rung, steps=steps, long_edge=long_edge)
+
+        mp = chosen["long_edge"] ** 2 / ratio / 1e6
+        chosen["estimate_s"] = int(chosen["steps"] * chosen["strength"]) * mp * cost
+
+        # Refine: full size upscale pass if the quick render left enough of the total budget
+        full_mp = self.profile["long_edge"] ** 2 / ratio / 1e6
+        refine_s = int(max_steps * REFINE_STRENGTH) * full_mp * cost
+        chosen["refine"] = (
+            (chosen["long_edge"] < self.profile["long_edge"] or chosen["steps"] < max_steps)
+            and chosen["estimate_s"] + refine_s <= remaining_s * 0.5
+        )
+        return chosen
@@ -0,0 +1,89 @@
+import os
+import math
+
+# Device/dtype presets for ImageGenerator. Chosen with RENDER_PROFILE in .env,
+# RENDER_THREADS overrides the CPU thread count, RENDER_COMPILE=1 (or 0) turns
+# torch.compile of the UNet on (or off); the first render then takes longer.
+#   sec_per_mp_step: rough seconds per diffusion step per megapixel, used to
+#   size images for a latency budget until real timings are known.
+#   low_memory: smallest attention slices, VAE slicing and single-image batches;
+#   on CUDA also model CPU offload.
+PROFILES = {
+    "cuda": {
+        "device": "cuda", "dtype": "float16", "steps": 30, "long_edge": 1024,
+        "threads": None, "channels_last": False, "compile": False,
+        "attention_slicing": False, "vae_tiling": False, "low_memory": False,
+        "sec_per_mp_step": 0.3,
+    },
+    "cuda_lowmem": {
+        "device": "cuda", "dtype": "float16", "steps": 30, "long_edge": 1024,
+        "threads": None, "channels_last": False, "compile": False,
+        "attention_slicing": True, "vae_tiling": True, "low_memory": True,
+        "sec_per_mp_step": 0.5,
+    },
+    "cpu": {
+        "device": "cpu", "dtype": "float32", "steps": 30, "long_edge": 768,
+        "threads": None, "channels_last": True, "compile": False,
+        "attention_slicing": True, "vae_tiling": True, "low_memory": False,
+        "sec_per_mp_step": 6.0,
+    },
+    "cpu_bf16": {
+        "device": "cpu", "dtype": "bfloat16", "steps": 30, "long_edge": 768,
+        "threads": None, "channels_last": True, "compile": False,
+        "attention_slicing": True, "vae_tiling": True, "low_memory": False,
+        "sec_per_mp_step": 4.0,
+    },
+    "cpu_lowmem": {
+        "device": "cpu", "dtype": "float32", "steps": 30, "long_edge": 512,
+        "threads": None, "channels_last": False, "compile": False,
+        "attention_slicing": True, "vae_tiling": True, "low_memory": True,
+        "sec_per_mp_step": 7.0,
+    },
+    # Fewer steps and lower resolution; DEIS still converges reasonably at 15 steps
+    "fast": {
+        "device": "cpu", "dtype": "float32", "steps": 15, "long_edge": 512,
+        "threads": None, "channels_last": True, "compile": False,
+        "attention_slicing": True, "vae_tiling": False, "low_memory": False,
+        "sec_per_mp_step": 6.0,
+    },
+}
+
+MIN_LONG_EDGE = 384
+
+def load_profile(name=None, cuda_available=True):
+    """Profile dict by name, defaulting to 'cuda' or 'cpu' depending on the machine."""
+    name = name or os.getenv("RENDER_PROFILE") or ("cuda" if cuda_available else "cpu")
+    if name not in PROFILES:
+        print(f"Unknown render profile '{name}', using 'cpu'")
+        name = "cpu"
+    profile = dict(PROFILES[name], name=name)
+
+    # 'fast' follows the machine it runs on
+    if name == "fast" and cuda_available:
+        profile.update(device="cuda", dtype="float16", sec_per_mp_step=0.3)
+    if not cuda_available and profile["device"] == "cuda":
+        print(f"Render profile '{name}' needs CUDA, falling back to 'cpu'")
+        profile = dict(PROFILES["cpu"], name="cpu")
+
+    threads = os.getenv("RENDER_THREADS")
+    if threads:
+        profile["threads"] = int(threads)
+    compile_unet = os.getenv("RENDER_COMPILE")
+    if compile_unet:
+        profile["compile"] = compile_unet.strip().lower() in ("1", "true", "yes", "on")
+    return profile
+
+def fit_long_edge(profile, ratio, budget_s=None, sec_per_mp_step=None):
+    """
+    Longest edge (multiple of 64) whose render fits in budget_s at the profile's
+    step count, capped at the profile's long_edge. ratio = long edge / short edge.
+    """
+    long_edge = profile["long_edge"]
+    if not budget_s:
+        return long_edge
+
+    cost = sec_per_mp_step or profile["sec_per_mp_step"]
+    megapixels = budget_s / (profile["steps"] * cost)
+    fitting = math.sqrt(megapixels * 1e6 * ratio)
+    fitting = int(fitting // 64) * 64
+    return max(MIN_LONG_EDGE, min(long_edge, fitting))
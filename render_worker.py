@@ -0,0 +1,327 @@
+import time
+import queue
+import itertools
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from job_control import CancelToken, JobCancelled
+from tracing import tracer
+
+# Finished frames handed to the GUI stay mapped until this many newer ones arrived
+KEEP_FRAMES = 2
+RESTART_BACKOFF_S = [1, 2, 5, 10, 30]
+
+# ---------------------------------------------------------------------------
+# Protocol (over a multiprocessing Pipe, plain dicts):
+#   GUI -> worker: {"cmd": "prompt" | "render" | "refine" | "translate", "job_id": n, ...args}
+#                  {"cmd": "cancel", "job_id": n}   {"cmd": "stop"}
+#   worker -> GUI: {"type": "ready", "profile": {...}}
+#                  {"type": "preview", "track_id", "size", "data"}
+#                  {"type": "done", "job_id", ...result}    frames travel as
+#                      "frame": {"shm": name, "size": (w, h)}  (RGBX pixels)
+#                  {"type": "cancelled" | "error", "job_id", "error"}
+#                  {"type": "fatal", "error"}   (model load failed)
+#                  {"type": "trace", "rec"}     (tracing.py record, only with TRACE=1)
+# ---------------------------------------------------------------------------
+
+class WorkerCrashed(Exception):
+    """The render process died while a job was running."""
+
+class _PipePreviewSender:
+    """Stands in for LatestFrameChannel inside the worker; previews are tiny, so they are pickled."""
+    def __init__(self, send):
+        self.send = send
+
+    def put(self, track_id, image):
+        self.send({"type": "preview", "track_id": track_id, "size": image.size, "data": image.tobytes()})
+
+def _frame_to_shm(image):
+    """
+    Copies an image into a fresh shared memory block as RGBX: Pillow can only map
+    4-byte-per-pixel raw buffers without copying, plain RGB would be copied again
+    on the GUI side. The GUI side unlinks the block.
+    """
+    image = image.convert("RGBX")
+    data = image.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    name = shm.name
+    shm.close()
+    return {"shm": name, "size": image.size}
+
+def default_services(preview_channel, preview_every):
+    """The worker's models: (translator, side translator, generator). Runs in the render process."""
+    from translator_service import TranslatorService
+    from image_generator import ImageGenerator
+    translator = TranslatorService()
+    # Batch translation for queued tracks runs on its own thread, so it never
+    # holds up the playing track's prompt or render; it shares the cache only
+    side_translator = TranslatorService(cache=translator.cache)
+    generator = ImageGenerator(preview_channel=preview_channel, preview_every=preview_every)
+    return translator, side_translator, generator
+
+def worker_main(conn, preview_every, services=default_services):
+    """
+    Entry point of the render process: owns the LLM client and the diffusion pipeline.
+    `services` builds them; it must be importable (picklable) for the spawn context.
+    """
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    # Spans recorded here are aggregated and exported by the GUI process
+    tracer.configure(sink=lambda rec: send({"type": "trace", "rec": rec}))
+    try:
+        translator, side_translator, generator = services(_PipePreviewSender(send), preview_every)
+    except Exception as e:
+        send({"type": "fatal", "error": str(e)})
+        return
+    send({"type": "ready", "profile": generator.profile})
+
+    tokens = {}
+    jobs = queue.Queue()
+    side_jobs = queue.Queue()
+
+    def run(msg, token):
+        token.check()
+        if msg["cmd"] == "prompt":
+            prompt, _, _ = translator.create_smart_prompt(
+                msg["title"], msg["artist"], msg["lyrics"], msg["genres"], cancel_token=token
+            )
+            return {"prompt": prompt}
+        if msg["cmd"] == "translate":
+            return {"calls": side_translator.translate_batch(msg["texts"], cancel_token=token)}
+        if msg["cmd"] == "render":
+            image = generator.generate_image(
+                msg["prompt"], msg["track_id"], album_art_url=msg["album_art"],
+                width=msg["width"], height=msg["height"], cancel_token=token,
+                steps=msg["steps"], strength=msg["strength"]
+            )
+        else:  # refine
+            image = generator.refine_image(
+                msg["prompt"], msg["track_id"], msg["width"], msg["height"],
+                strength=msg["strength"], cancel_token=token
+            )
+        return {"frame": _frame_to_shm(image), "timing": generator.last_timing}
+
+    def run_jobs(job_queue):
+        while True:
+            msg = job_queue.get()
+            job_id = msg["job_id"]
+            token = tokens.get(job_id)
+            try:
+                with tracer.job(msg.get("track_id")):
+                    result = run(msg, token)
+                send(dict(result, type="done", job_id=job_id))
+            except JobCancelled:
+                send({"type": "cancelled", "job_id": job_id})
+            except Exception as e:
+                send({"type": "error", "job_id": job_id, "error": str(e)})
+            finally:
+                tokens.pop(job_id, None)
+
+    threading.Thread(target=run_jobs, args=(jobs,), daemon=True).start()
+    threading.Thread(target=run_jobs, args=(side_jobs,), daemon=True).start()
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return  # GUI went away
+        if msg["cmd"] == "stop":
+            return
+        if msg["cmd"] == "cancel":
+            token = tokens.get(msg["job_id"])
+            if token:
+                token.cancel()
+            continue
+        tokens[msg["job_id"]] = CancelToken()
+        (side_jobs if msg["cmd"] == "translate" else jobs).put(msg)
+
+class RenderClient:
+    """
+    GUI-side handle on the render process. Calls block the calling (scheduler)
+    thread, forward cancellation, and raise WorkerCrashed if the process dies;
+    the process is then restarted in the background with backoff.
+    """
+    def __init__(self, preview_channel=None, preview_every=0, on_ready=None, services=None):
+        self.preview_channel = preview_channel
+        self.preview_every = preview_every
+        self.on_ready = on_ready
+        # Builds the worker's models (see default_services); benchmarks pass offline fakes
+        self.services = services or default_services
+        self.profile = None
+        self.ready = threading.Event()
+        self.running = True
+        # Set when the models failed to load; restarting would only fail the same way
+        self.fatal_error = None
+
+        self._ctx = mp.get_context("spawn")  # never fork a process that holds Tk/CUDA state
+        self._ids = itertools.count(1)
+        self._pending = {}  # job_id -> {"event": Event, "reply": dict}
+        self._lock = threading.Lock()
+        self._frames = deque()
+        self._restarts = 0
+        self._start()
+
+    # --- public calls ---
+    def prompt(self, track, lyrics, cancel_token=None):
+        reply = self._request({
+            "cmd": "prompt", "track_id": track["id"], "title": track["title"], "artist": track["artist"],
+            "lyrics": lyrics, "genres": track.get("genres", []),
+        }, cancel_token)
+        return reply["prompt"]
+
+    def translate_batch(self, texts, cancel_token=None):
+        """Pre-translates lyrics of queued tracks in shared requests; their prompts then hit the cache."""
+        return self._request({"cmd": "translate", "texts": texts}, cancel_token)["calls"]
+
+    def render(self, prompt, track, width, height, steps=None, strength=0.85, cancel_token=None):
+        """Returns (frame, timing). The frame is backed by shared memory; no PNG round trip."""
+        reply = self._request({
+            "cmd": "render", "prompt": prompt, "track_id": track["id"], "album_art": track.get("album_art"),
+            "width": width, "height": height, "steps": steps, "strength": strength,
+        }, cancel_token)
+        return self._attach_frame(reply["frame"]), reply["timing"]
+
+    def refine(self, prompt, track, width, height, strength, cancel_token=None):
+        reply = self._request({
+            "cmd": "refine", "prompt": prompt, "track_id": track["id"],
+            "width": width, "height": height, "strength": strength,
+        }, cancel_token)
+        return self._attach_frame(reply["frame"]), reply["timing"]
+
+    def stop(self):
+        self.running = False
+        try:
+            self.conn.send({"cmd": "stop"})
+        except Exception:
+            pass
+
+    # --- process management ---
+    def _start(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        self.proc = self._ctx.Process(
+            target=worker_main, args=(child_conn, self.preview_every, self.services), daemon=True,
+            name="render-worker"
+        )
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._reader, args=(parent_conn,), daemon=True).start()
+
+    def _reader(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = msg["type"]
+            if kind == "ready":
+                self.profile = msg["profile"]
+                self._restarts = 0
+                if self.on_ready:
+                    self.on_ready(self.profile)
+                self.ready.set()
+                print("⚙️ Render worker ready")
+            elif kind == "preview":
+                if self.preview_channel:
+                    self.preview_channel.put(msg["track_id"], Image.frombytes("RGB", msg["size"], msg["data"]))
+            elif kind == "trace":
+                tracer.record(msg["rec"])
+            elif kind == "fatal":
+                self.fatal_error = msg["error"]
+                print(f"Render worker failed to start: {msg['error']}")
+            else:
+                with self._lock:
+                    waiter = self._pending.get(msg["job_id"])
+                if waiter:
+                    waiter["reply"] = msg
+                    waiter["event"].set()
+        self._on_exit()
+
+    def _on_exit(self):
+        """Worker died (crash, OOM kill) or stopped: fail waiting jobs, then restart."""
+        self.ready.clear()
+        self.proc.join(timeout=1)
+        with self._lock:
+            for waiter in self._pending.values():
+                waiter["reply"] = {"type": "crashed"}
+                waiter["event"].set()
+        if not self.running:
+            return
+        if self.fatal_error:
+            print("⚠️ Render worker not restarted; AI art is disabled for this session")
+            return
+        delay = RESTART_BACKOFF_S[min(self._restarts, len(RESTART_BACKOFF_S) - 1)]
+        self._restarts += 1
+        print(f"⚠️ Render worker exited (code {self.proc.exitcode}), restarting in {delay}s")
+        time.sleep(delay)
+        if self.running:
+            self._start()
+
+    def wait_ready(self, cancel_token=None):
+        """Blocks until the models are loaded; raises WorkerCrashed if they never will be."""
+        while not self.ready.wait(0.5):
+            if self.fatal_error:
+                raise WorkerCrashed(f"render worker failed to start: {self.fatal_error}")
+            if cancel_token:
+                cancel_token.check()
+
+    def _request(self, msg, cancel_token):
+        self.wait_ready(cancel_token)
+
+        job_id = next(self._ids)
+        waiter = {"event": threading.Event(), "reply": None}
+        with self._lock:
+            self._pending[job_id] = waiter
+        try:
+            self._send(dict(msg, job_id=job_id))
+            cancel_sent = False
+            while not waiter["event"].wait(0.1):
+                if cancel_token and cancel_token.cancelled and not cancel_sent:
+                    self._send({"cmd": "cancel", "job_id": job_id})
+                    cancel_sent = True
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+        reply = waiter["reply"]
+        if reply["type"] == "done":
+            return reply
+        if reply["type"] == "cancelled":
+            raise JobCancelled()
+        if reply["type"] == "crashed":
+            raise WorkerCrashed("render worker exited during the job")
+        raise RuntimeError(reply.get("error", "render failed"))
+
+    def _send(self, msg):
+        try:
+            with self._send_lock:
+                self.conn.send(msg)
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerCrashed(f"render worker unreachable: {e}")
+
+    def _attach_frame(self, frame):
+        """Maps the worker's frame without copying it; the block is released KEEP_FRAMES frames later."""
+        shm = shared_memory.SharedMemory(name=frame["shm"])
+        shm.unlink()  # the mapping stays valid; the name is no longer needed
+        # RGBX is in Image._MAPMODES, so this maps shm.buf instead of copying it
+        image = Image.frombuffer("RGBX", tuple(frame["size"]), shm.buf, "raw", "RGBX", 0, 1)
+        self._frames.append(shm)
+        while len(self._frames) > KEEP_FRAMES:
+            old = self._frames.popleft()
+            try:
+                old.close()
+            except BufferError:
+                # An image still references it; try again with the next frame
+                self._frames.appendleft(old)
+                break
+        return image
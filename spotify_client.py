@@ -1,34 +1,60 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import os
+import time
+from collections import deque
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Artist genres barely change; one lookup per artist per day is plenty
+GENRE_TTL = 24 * 3600
+
 class SpotifyHandler:
-    def __init__(self):
+    def __init__(self, sp=None):
         self.scope = "user-read-currently-playing user-read-playback-state user-modify-playback-state"
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+        # `sp` lets a fake client stand in for spotipy.Spotify
+        self.sp = sp or spotipy.Spotify(auth_manager=SpotifyOAuth(
             client_id=os.getenv("SPOTIFY_CLIENT_ID"),
             client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
             redirect_uri=os.getenv("REDIRECT_URI"),
             scope=self.scope
         ))
+        self.genre_cache = {}  # artist_id -> (genres, fetched_at)
+        self.call_times = deque()
+
+    def _api(self, method, *args):
+        """Every Web API request goes through here so calls per hour can be counted."""
+        self.call_times.append(time.time())
+        return getattr(self.sp, method)(*args)
+
+    def calls_last_hour(self):
+        cutoff = time.time() - 3600
+        while self.call_times and self.call_times[0] < cutoff:
+            self.call_times.popleft()
+        return len(self.call_times)
+
+    def _get_genres(self, artist_id):
+        cached = self.genre_cache.get(artist_id)
+        if cached and time.time() - cached[1] < GENRE_TTL:
+            return cached[0]
+        try:
+            artist_info = self._api("artist", artist_id)
+            genres = artist_info.get('genres', [])
+        except:
+            return ["music"]  # not cached, so the next poll retries
+        self.genre_cache[artist_id] = (genres, time.time())
+        return genres
 
     def get_current_track(self):
         """Fetches current track metadata including sync and genre info."""
-        item = self.sp.current_user_playing_track()
+        item = self._api("current_user_playing_track")
         if not item or not item['item']: 
             return None
 
         track = item['item']
         artist_id = track['artists'][0]['id']
-        
-        try:
-            artist_info = self.sp.artist(artist_id)
-            genres = artist_info.get('genres', [])
-        except:
-            genres = ["music"]
+        genres = self._get_genres(artist_id)
 
         return {
             'id': track['id'],
@@ -38,25 +64,56 @@ class SpotifyHandler:
             'genres': genres,
             'progress_ms': item.get('progress_ms', 0),
             'is_playing': item.get('is_playing', False),
-            'duration_ms': track['duration_ms'] # <--- Added for LRCLIB
+            'duration_ms': track['duration_ms'], # <--- Added for LRCLIB
+            'polled_at': time.time()
         }
 
-    def get_queue(self):
+    def get_queue(self, limit=3):
+        """Returns up to `limit` upcoming tracks, in play order."""
         try:
-            queue_data = self.sp.queue()
-            if queue_data and 'queue' in queue_data and len(queue_data['queue']) > 0:
-                next_track = queue_data['queue'][0]
-                return {
-                    'id': next_track['id'],
-                    'title': next_track['name'],
-                    'artist': next_track['artists'][0]['name']
-                }
-            return None
+            queue_data = self._api("queue")
+            if not queue_data or not queue_data.get('queue'):
+                return []
+
+            upcoming = []
+            for next_track in queue_data['queue']:
+                info = self._track_info(next_track)
+                if info:
+                    upcoming.append(info)
+                if len(upcoming) == limit:
+                    break
+            return upcoming
         except Exception as e:
             print(f"Error fetching queue: {e}")
+            return []
+
+    def get_playlist_tracks(self, playlist_id):
+        """Every track of a playlist (id, URI or URL), in the same format as get_queue()."""
+        tracks = []
+        page = self._api("playlist_items", playlist_id)
+        while page:
+            for entry in page.get('items', []):
+                info = self._track_info(entry.get('track'))
+                if info:
+                    tracks.append(info)
+            page = self._api("next", page) if page.get('next') else None
+        return tracks
+
+    def _track_info(self, track):
+        # Podcast episodes and local files have no artist/album art to work with
+        if not track or not track.get('id') or not track.get('artists'):
             return None
+        images = track.get('album', {}).get('images', [])
+        return {
+            'id': track['id'],
+            'title': track['name'],
+            'artist': track['artists'][0]['name'],
+            'album_art': images[0]['url'] if images else None,
+            'genres': self._get_genres(track['artists'][0]['id']),
+            'duration_ms': track.get('duration_ms', 0)
+        }
 
-    def next_track(self): self.sp.next_track()
-    def previous_track(self): self.sp.previous_track()
-    def pause_playback(self): self.sp.pause_playback()
-    def start_playback(self): self.sp.start_playback()
\ No newline at end of file
+    def next_track(self): self._api("next_track")
+    def previous_track(self): self._api("previous_track")
+    def pause_playback(self): self._api("pause_playback")
+    def start_playback(self): self._api("start_playback")
\ No newline at end of file
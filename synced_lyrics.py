@@ -0,0 +1,63 @@
+import re
+from bisect import bisect_right
+
+# [mm:ss], [mm:ss.xx] or [mm:ss:xx]; a line may carry several tags
+TIME_TAG = re.compile(r"\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]")
+
+def is_synced(text):
+    return bool(text) and TIME_TAG.search(text) is not None
+
+def plain_lyrics(text):
+    """Strips LRC time tags (and metadata tags like [ar:...]) leaving plain lyrics."""
+    if not is_synced(text):
+        return text
+    lines = []
+    for raw in text.splitlines():
+        line = TIME_TAG.sub("", raw).strip()
+        if re.fullmatch(r"\[\w+:.*\]", line):
+            continue
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+class LyricsTimeline:
+    """
+    Time-synced lyrics as two parallel sorted lists, so finding the line for
+    a given progress_ms is a single binary search.
+    """
+    def __init__(self, times_ms, lines):
+        self.times_ms = times_ms
+        self.lines = lines
+
+    @classmethod
+    def from_lrc(cls, text):
+        if not is_synced(text):
+            return None
+        entries = []
+        for raw in text.splitlines():
+            tags = TIME_TAG.findall(raw)
+            if not tags:
+                continue
+            line = TIME_TAG.sub("", raw).strip()
+            for mins, secs, frac in tags:
+                ms = (int(mins) * 60 + int(secs)) * 1000
+                if frac:
+                    ms += int(frac.ljust(3, "0")[:3])
+                entries.append((ms, line))
+        if not entries:
+            return None
+        entries.sort(key=lambda e: e[0])
+        return cls([e[0] for e in entries], [e[1] for e in entries])
+
+    def index_at(self, progress_ms):
+        """Index of the line being sung at progress_ms, or -1 before the first line."""
+        return bisect_right(self.times_ms, progress_ms) - 1
+
+    def line_at(self, progress_ms):
+        i = self.index_at(progress_ms)
+        return self.lines[i] if i >= 0 else ""
+
+    def section_around(self, progress_ms, before=4, after=12):
+        """The lines around the current position, for prompts about what is playing now."""
+        i = max(self.index_at(progress_ms), 0)
+        chunk = self.lines[max(i - before, 0):i + after + 1]
+        return "\n".join(line for line in chunk if line)
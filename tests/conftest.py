@@ -0,0 +1,35 @@
+"""
+Shared test setup. Every remote API is replaced by a local http.server
+stand-in, so the suite runs without network access or API keys.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name -> list of seconds, printed as p50/p99 after the run
+_latencies = {}
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else None
+
+@pytest.fixture
+def latency_report():
+    """record(name, seconds) collects a latency for the p50/p99 summary at the end of the run."""
+    def record(name, seconds):
+        _latencies.setdefault(name, []).append(seconds)
+    return record
+
+def pytest_terminal_summary(terminalreporter):
+    if not _latencies:
+        return
+    terminalreporter.section("latency")
+    for name, values in sorted(_latencies.items()):
+        terminalreporter.write_line(
+            f"{name:<32} n={len(values):<4} p50={1000 * percentile(values, 0.5):8.1f}ms "
+            f"p99={1000 * percentile(values, 0.99):8.1f}ms"
+        )
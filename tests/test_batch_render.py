@@ -0,0 +1,80 @@
+"""BatchRenderer stages with fakes for the lyrics engine, the LLM and the generator."""
+import time
+import threading
+from concurrent.futures import Future
+
+import ollama
+import pytest
+
+import batch_render
+import translator_service
+from batch_render import BatchRenderer, Progress
+from prompt_cache import PromptCache
+
+class FakeArtStore:
+    def __init__(self, stored=()):
+        self.stored = set(stored)
+
+    def has(self, track_id):
+        return track_id in self.stored
+
+class FakeGenerator:
+    max_batch = 3
+
+    def __init__(self):
+        self.batches = []
+
+    def generate_batch(self, jobs, steps=None):
+        self.batches.append([job["track_id"] for job in jobs])
+
+def track(t_id):
+    return {"id": t_id, "title": f"Song {t_id}", "artist": "Band", "genres": []}
+
+@pytest.fixture
+def renderer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the lyrics cache lives in the working directory
+
+    def make(tracks, stored=()):
+        return BatchRenderer(
+            tracks, 64, 64, progress=Progress(str(tmp_path / "progress.json")), art_store=FakeArtStore(stored)
+        )
+    return make
+
+def test_pending_skips_duplicates_and_finished_tracks(renderer):
+    r = renderer([track("a"), track("b"), track("a"), track("c"), track("b")], stored={"c"})
+    assert [t["id"] for t in r.pending()] == ["a", "b"]
+    assert r.stats["skipped"] == 1
+
+def test_render_loop_batches_waiting_prompts(renderer):
+    r = renderer([])
+    for t_id in "abcd":
+        r.prompt_q.put((track(t_id), f"prompt {t_id}"))
+
+    def rest():
+        r.prompt_q.put((track("e"), "prompt e"))
+        r.prompt_q.put(batch_render._DONE)
+
+    threading.Thread(target=rest).start()
+    generator = FakeGenerator()
+    r._render_loop(generator, 5, time.perf_counter())
+
+    assert [t for batch in generator.batches for t in batch] == list("abcde")
+    assert all(len(batch) <= generator.max_batch for batch in generator.batches)
+    assert r.stats["rendered"] == 5
+    assert r.progress.status("e")["status"] == "done"
+
+def test_llm_fallback_fails_the_track_for_a_retry(renderer, tmp_path, monkeypatch):
+    monkeypatch.setattr(translator_service.ollama, "generate", ollama.Client(host="http://127.0.0.1:1").generate)
+    r = renderer([])
+    lyrics = Future()
+    # English, so no translation request is made
+    lyrics.set_result(("a", "I walk the streets alone at night and you are not there with me"))
+    r.lyrics_q.put((track("a"), lyrics))
+    r.lyrics_q.put(batch_render._DONE)
+
+    r._prompt_worker(PromptCache(str(tmp_path / "prompt_cache.db")))
+
+    assert r.prompt_q.empty()  # nothing generic reaches the diffusion stage
+    assert r.stats["failed"] == 1
+    item = r.progress.status("a")
+    assert item["status"] == "failed" and "LLM unavailable" in item["error"]
@@ -0,0 +1,179 @@
+"""FreeLyricsHandler against a local LRCLIB / lyrics.ovh stand-in."""
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+import lyrics_provider
+import lyrics_sources
+from lyrics_cache import LyricsCache, SQLiteBackend
+from lyrics_provider import FreeLyricsHandler
+from lyrics_sources import LrclibProvider, LyricsOvhProvider
+
+class FakeLyricsServer:
+    """
+    /lrclib/get?artist_name=&track_name=  and  /ovh/<artist>/<title>.
+    Every title is found on LRCLIB unless listed in `missing`; titles in
+    `failing` get a 503 from both; `delays` maps a title to seconds slept
+    before answering.
+    """
+    def __init__(self):
+        self.delay = 0.0
+        self.delays = {}
+        self.missing = set()
+        self.failing = set()
+        self.requests = {}  # (route, title) -> count
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, route, title=None):
+        return sum(n for (r, t), n in self.requests.items() if r == route and title in (None, t))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [unquote(p) for p in url.path.strip("/").split("/")]
+                if parts[0] == "lrclib":
+                    route, title = "lrclib", parse_qs(url.query).get("track_name", [""])[0]
+                else:
+                    route, title = "lyrics.ovh", parts[-1]
+                with fake._lock:
+                    fake.requests[(route, title)] = fake.requests.get((route, title), 0) + 1
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                try:
+                    time.sleep(fake.delays.get(title, fake.delay))
+                finally:
+                    with fake._lock:
+                        fake.active -= 1
+                if title in fake.failing:
+                    return self._send(503, {"message": "unavailable"})
+                if route == "lyrics.ovh" or title in fake.missing:
+                    return self._send(404, {"message": "not found"})
+                return self._send(200, {"syncedLyrics": None, "plainLyrics": f"lyrics of {title}"})
+
+            def _send(self, status, obj):
+                data = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeLyricsServer()
+    monkeypatch.setattr(lyrics_sources, "LRCLIB_URL", f"{fake.url}/lrclib")
+    monkeypatch.setattr(lyrics_sources, "LYRICS_OVH_URL", f"{fake.url}/ovh")
+    yield fake
+    fake.server.shutdown()
+
+@pytest.fixture
+def handler(tmp_path, server):
+    cache = LyricsCache(SQLiteBackend(str(tmp_path / "lyrics_cache.db")))
+    engine = FreeLyricsHandler(cache=cache, providers=[LrclibProvider(), LyricsOvhProvider()])
+    yield engine
+    engine.pool.shutdown(wait=False)
+    engine.provider_pool.shutdown(wait=False)
+
+def track(n):
+    return {"id": f"t{n}", "title": f"song{n}", "artist": "band"}
+
+def test_pool_runs_lookups_concurrently(server, handler, latency_report):
+    server.delay = 0.2
+    tracks = [track(n) for n in range(lyrics_provider.MAX_WORKERS * 2)]
+
+    start = time.perf_counter()
+    result = handler.get_lyrics_for_queue(tracks[0], tracks[1:])
+    wall = time.perf_counter() - start
+
+    assert result["current"] == "lyrics of song0"
+    assert all(result["queue"][t["id"]] == f"lyrics of {t['title']}" for t in tracks[1:])
+    # Two rounds of MAX_WORKERS requests, not one request after the other
+    assert server.max_active == lyrics_provider.MAX_WORKERS
+    assert wall < len(tracks) * server.delay / 2
+    latency_report("lyrics batch of 8 (200ms server)", wall)
+
+def test_fetch_async_coalesces_inflight_requests(server, handler):
+    server.delay = 0.3
+    with ThreadPoolExecutor(8) as callers:
+        futures = list(callers.map(lambda _: handler.fetch_async(track(1)), range(8)))
+
+    assert len({id(f) for f in futures}) == 1
+    assert futures[0].result(timeout=5) == ("t1", "lyrics of song1")
+    assert server.count("lrclib", "song1") == 1
+    # Afterwards it is a cache hit, not another request
+    assert handler.fetch_async(track(1)).result() == ("t1", "lyrics of song1")
+    assert server.count("lrclib", "song1") == 1
+
+def test_batch_deadline_cuts_off_slow_tracks(server, handler):
+    server.delays["song2"] = 1.5
+    start = time.perf_counter()
+    result = handler.get_lyrics_for_queue(track(1), [track(2)], deadline=0.4)
+    wall = time.perf_counter() - start
+
+    assert wall < 1.0
+    assert result["current"] == "lyrics of song1"
+    assert result["queue"] == {"t2": ""}
+    # The slow lookup keeps running and is cached for next time
+    assert handler.fetch_async(track(2)).result(timeout=5) == ("t2", "lyrics of song2")
+    assert handler.cache.get("t2") == "lyrics of song2"
+
+def test_hedge_answers_from_the_faster_provider(server, handler, monkeypatch):
+    monkeypatch.setattr(lyrics_provider, "HEDGE_DELAY", 0.1)
+    server.delays["song3"] = 2.0  # LRCLIB is slow for this one
+
+    class FastOvh(LyricsOvhProvider):
+        def fetch(self, track, session, cancelled):
+            return "from ovh"
+
+    handler.providers = [LrclibProvider(), FastOvh()]
+    start = time.perf_counter()
+    assert handler.fetch_async(track(3)).result(timeout=5) == ("t3", "from ovh")
+    assert time.perf_counter() - start < 1.0
+
+def test_missing_lyrics_are_cached_as_misses(server, handler, monkeypatch):
+    server.missing.add("song4")
+    assert handler.fetch_async(track(4)).result(timeout=5) == ("t4", "")
+    assert handler.fetch_async(track(4)).result(timeout=5) == ("t4", "")
+    assert server.count("lrclib", "song4") == 1
+    assert server.count("lyrics.ovh", "song4") == 1
+
+    # Server errors are not a "no lyrics" answer: nothing is cached and the next lookup retries
+    server.failing.add("song5")
+    assert handler.fetch_async(track(5)).result(timeout=5) == ("t5", "")
+    assert handler.cache.get("t5") is None
+    server.failing.discard("song5")
+    assert handler.fetch_async(track(5)).result(timeout=5) == ("t5", "lyrics of song5")
+
+    # Same for a source that cannot be reached at all
+    monkeypatch.setattr(lyrics_sources, "LRCLIB_URL", "http://127.0.0.1:1")
+    monkeypatch.setattr(lyrics_sources, "LYRICS_OVH_URL", "http://127.0.0.1:1")
+    assert handler.fetch_async(track(6)).result(timeout=5) == ("t6", "")
+    assert handler.cache.get("t6") is None
+
+def test_fetch_latency(server, handler, latency_report):
+    server.delay = 0.02
+    for n in range(40):
+        start = time.perf_counter()
+        handler.fetch_async(track(100 + n)).result(timeout=5)
+        latency_report("lyrics fetch (20ms server)", time.perf_counter() - start)
+    start = time.perf_counter()
+    handler.fetch_async(track(100)).result()
+    latency_report("lyrics fetch (cache hit)", time.perf_counter() - start)
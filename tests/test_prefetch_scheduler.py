@@ -0,0 +1,90 @@
+"""PrefetchScheduler ordering, dedup and cancellation with a fake render function."""
+import threading
+
+from job_control import JobCancelled
+from prefetch_scheduler import PRIORITY_CURRENT, PRIORITY_PREFETCH, PrefetchScheduler
+
+class FakeRender:
+    """Blocks every job until released; cancelled jobs unwind only when allowed to."""
+    def __init__(self):
+        self.runs = []
+        self.done = []
+        self.started = threading.Semaphore(0)
+        self.unwind = threading.Event()
+        self.release = {}
+
+    def __call__(self, track, token):
+        t_id = track["id"]
+        self.runs.append(t_id)
+        gate = self.release.setdefault(t_id, threading.Event())
+        self.started.release()
+        while not gate.wait(0.01):
+            if token.cancelled:
+                self.unwind.wait(5)  # e.g. a diffusion step still finishing
+                token.check()
+        self.done.append(t_id)
+        return t_id
+
+    def wait_started(self):
+        assert self.started.acquire(timeout=5)
+
+def track(t_id):
+    return {"id": t_id, "title": t_id}
+
+def scheduler_for(render):
+    finished = threading.Event()
+    done = []
+
+    def on_done(track, result):
+        done.append(track["id"])
+        finished.set()
+
+    return PrefetchScheduler(render, on_done=on_done), done, finished
+
+def test_skip_back_while_the_cancelled_job_unwinds():
+    render = FakeRender()
+    scheduler, done, finished = scheduler_for(render)
+    scheduler.submit(track("A"), PRIORITY_CURRENT)
+    render.wait_started()
+
+    scheduler.submit(track("B"), PRIORITY_CURRENT)  # skip: A is cancelled but still unwinding
+    assert scheduler.submit(track("A"), PRIORITY_CURRENT)  # back to A before A exits
+    assert scheduler.is_busy_with("A")
+
+    render.release["A"] = threading.Event()
+    render.release["A"].set()
+    render.unwind.set()
+    render.wait_started()
+    assert finished.wait(5)
+    scheduler.stop()
+    assert render.runs == ["A", "A"]
+    assert done == ["A"]
+
+def test_preempted_prefetch_is_requeued():
+    render = FakeRender()
+    scheduler, done, finished = scheduler_for(render)
+    scheduler.submit(track("Q"), PRIORITY_PREFETCH)
+    render.wait_started()
+
+    scheduler.submit(track("C"), PRIORITY_CURRENT)  # preempts Q
+    assert scheduler.submit(track("Q"), PRIORITY_PREFETCH)  # prefetch_queue re-submits it
+
+    for t_id in ("C", "Q"):
+        render.release.setdefault(t_id, threading.Event()).set()
+    render.unwind.set()
+    render.wait_started()
+    render.wait_started()
+    scheduler.stop()
+    assert render.runs == ["Q", "C", "Q"]
+
+def test_running_job_is_deduplicated():
+    render = FakeRender()
+    scheduler, _, _ = scheduler_for(render)
+    scheduler.submit(track("A"), PRIORITY_PREFETCH)
+    render.wait_started()
+
+    assert not scheduler.submit(track("A"), PRIORITY_CURRENT)
+    assert not scheduler.submit(track("A"), PRIORITY_PREFETCH)
+    render.release["A"].set()
+    scheduler.stop()
+    assert render.runs == ["A"]
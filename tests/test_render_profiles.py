@@ -0,0 +1,25 @@
+"""load_profile selection and its environment overrides."""
+import pytest
+
+from render_profiles import load_profile
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in ("RENDER_PROFILE", "RENDER_THREADS", "RENDER_COMPILE"):
+        monkeypatch.delenv(name, raising=False)
+
+def test_default_follows_the_machine():
+    assert load_profile(cuda_available=True)["name"] == "cuda"
+    assert load_profile(cuda_available=False)["name"] == "cpu"
+    assert load_profile("cuda_lowmem", cuda_available=False)["name"] == "cpu"
+
+@pytest.mark.parametrize("value, expected", [("1", True), ("true", True), ("0", False), ("off", False)])
+def test_render_compile_override(monkeypatch, value, expected):
+    monkeypatch.setenv("RENDER_COMPILE", value)
+    assert load_profile("cpu", cuda_available=False)["compile"] is expected
+
+def test_render_threads_override(monkeypatch):
+    monkeypatch.setenv("RENDER_THREADS", "6")
+    profile = load_profile("cpu", cuda_available=False)
+    assert profile["threads"] == 6
+    assert profile["compile"] is False
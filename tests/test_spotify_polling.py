@@ -0,0 +1,230 @@
+"""PollScheduler and SpotifyHandler with a fake clock and a fake spotipy client."""
+import pytest
+from spotipy import SpotifyException
+
+import poll_scheduler
+import spotify_client
+from poll_scheduler import PollScheduler
+from spotify_client import GENRE_TTL, SpotifyHandler
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    # stands in for the time module in spotify_client
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+class FakeSpotify:
+    """
+    spotipy.Spotify stand-in playing `durations` (seconds) back to back from
+    `started_at` on the fake clock. `errors` are raised by the next calls.
+    """
+    def __init__(self, clock, durations, started_at=None):
+        self.clock = clock
+        self.durations = durations
+        self.started_at = clock() if started_at is None else started_at
+        self.playing = True
+        self.errors = []
+        self.artist_calls = 0
+        self.artist_error = None
+
+    def boundaries(self):
+        t, out = self.started_at, []
+        for duration in self.durations:
+            t += duration
+            out.append(t)
+        return out
+
+    def _position(self):
+        elapsed = self.clock() - self.started_at
+        for index, duration in enumerate(self.durations):
+            if elapsed < duration:
+                return index, elapsed
+            elapsed -= duration
+        return None, 0
+
+    def _track(self, index):
+        return {
+            "id": f"t{index}", "name": f"Song {index}", "duration_ms": int(self.durations[index] * 1000),
+            "artists": [{"id": f"artist{index % 2}", "name": f"Artist {index % 2}"}],
+            "album": {"images": [{"url": f"https://art/{index}"}]},
+        }
+
+    def current_user_playing_track(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        index, elapsed = self._position()
+        if index is None:
+            return None
+        return {"item": self._track(index), "progress_ms": int(elapsed * 1000), "is_playing": self.playing}
+
+    def queue(self):
+        index, _ = self._position()
+        return {"queue": [self._track(i) for i in range(index + 1, len(self.durations))]}
+
+    def artist(self, artist_id):
+        self.artist_calls += 1
+        if self.artist_error:
+            raise self.artist_error
+        return {"genres": [f"{artist_id}-genre"]}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(spotify_client, "time", clock)
+    return clock
+
+def rate_limited(retry_after):
+    return SpotifyException(429, -1, "rate limited", headers={"Retry-After": str(retry_after)})
+
+def poll_once(spotify, poller, last_track_id):
+    """One iteration of SpotifyAIApp.main_loop without the GUI: (track id, delay)."""
+    try:
+        current = spotify.get_current_track()
+        if current and current["id"] != last_track_id:
+            last_track_id = current["id"]
+            poller.on_track_change()
+        delay = poller.next_delay(current)
+    except Exception as e:
+        retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+        delay = poller.on_error(retry_after)
+    return last_track_id, delay
+
+# --- next_delay ---
+
+def playing(duration_s, progress_s, is_playing=True):
+    return {"id": "t", "duration_ms": duration_s * 1000, "progress_ms": progress_s * 1000, "is_playing": is_playing}
+
+def test_next_delay_is_long_mid_song_and_dense_near_the_end(clock):
+    poller = PollScheduler(clock)
+    assert poller.next_delay(playing(200, 10)) == poll_scheduler.MAX_INTERVAL
+    assert poller.next_delay(playing(200, 195)) == 5 - poll_scheduler.BOUNDARY_MARGIN
+    assert poller.next_delay(playing(200, 199)) == poll_scheduler.MIN_INTERVAL
+    assert poller.predicted_end == clock() + 1
+
+def test_next_delay_when_paused_idle_or_without_duration(clock):
+    poller = PollScheduler(clock)
+    assert poller.next_delay(playing(200, 199, is_playing=False)) == poll_scheduler.PAUSED_INTERVAL
+    assert poller.predicted_end is None  # a paused track has no boundary to predict
+    assert poller.next_delay(None) == poll_scheduler.IDLE_INTERVAL
+    assert poller.next_delay({"id": "t", "is_playing": True}) == poll_scheduler.MIN_INTERVAL
+
+def test_nudge_polls_densely_for_the_burst_window(clock):
+    poller = PollScheduler(clock)
+    poller.nudge()
+    assert poller.wake.is_set()
+    assert poller.next_delay(playing(200, 10)) == poll_scheduler.BURST_INTERVAL
+    clock.advance(poll_scheduler.BURST_WINDOW + 0.1)
+    assert poller.next_delay(playing(200, 10)) == poll_scheduler.MAX_INTERVAL
+
+# --- errors ---
+
+def test_error_backoff_doubles_up_to_the_cap_and_resets(clock):
+    poller = PollScheduler(clock)
+    delays = [poller.on_error() for _ in range(8)]
+    assert delays[:4] == [2.0, 4.0, 8.0, 16.0]
+    assert max(delays) == poll_scheduler.BACKOFF_MAX
+    poller.next_delay(playing(200, 10))
+    assert poller.on_error() == poll_scheduler.BACKOFF_BASE
+
+def test_retry_after_from_a_rate_limit_wins(clock):
+    fake = FakeSpotify(clock, [200])
+    fake.errors = [rate_limited(17), RuntimeError("connection reset")]
+    spotify, poller = SpotifyHandler(sp=fake), PollScheduler(clock)
+
+    assert poll_once(spotify, poller, None) == (None, 17.0)
+    # A plain error after it backs off from the error count, not from Retry-After
+    assert poll_once(spotify, poller, None) == (None, 4.0)
+    assert poll_once(spotify, poller, None)[0] == "t0"
+    assert poller.errors == 0
+
+# --- SpotifyHandler ---
+
+def test_genres_are_cached_for_the_ttl(clock):
+    fake = FakeSpotify(clock, [3600 * 30])
+    spotify = SpotifyHandler(sp=fake)
+
+    assert spotify.get_current_track()["genres"] == ["artist0-genre"]
+    clock.advance(GENRE_TTL - 1)
+    spotify.get_current_track()
+    assert fake.artist_calls == 1
+    clock.advance(2)
+    spotify.get_current_track()
+    assert fake.artist_calls == 2
+
+def test_failed_genre_lookup_is_retried(clock):
+    fake = FakeSpotify(clock, [200])
+    fake.artist_error = RuntimeError("503")
+    spotify = SpotifyHandler(sp=fake)
+
+    assert spotify.get_current_track()["genres"] == ["music"]
+    fake.artist_error = None
+    assert spotify.get_current_track()["genres"] == ["artist0-genre"]
+    assert fake.artist_calls == 2
+
+def test_queue_shares_the_genre_cache(clock):
+    fake = FakeSpotify(clock, [200, 200, 200, 200])
+    spotify = SpotifyHandler(sp=fake)
+    spotify.get_current_track()
+    upcoming = spotify.get_queue(limit=2)
+
+    assert [t["id"] for t in upcoming] == ["t1", "t2"]
+    assert fake.artist_calls == 2  # artist0 and artist1, each once
+
+def test_calls_last_hour_drops_old_calls(clock):
+    spotify = SpotifyHandler(sp=FakeSpotify(clock, [200]))
+    spotify.get_current_track()  # playing track + artist lookup
+    clock.advance(1800)
+    spotify.get_current_track()  # genres cached
+    assert spotify.calls_last_hour() == 3
+    clock.advance(1801)
+    assert spotify.calls_last_hour() == 1
+    clock.advance(1800)
+    assert spotify.calls_last_hour() == 0
+
+# --- detection latency ---
+
+def test_track_changes_are_seen_within_a_poll_of_the_boundary(clock, latency_report):
+    durations = [30.4, 45.75, 12.1, 60.3, 25.55, 90.2]
+    fake = FakeSpotify(clock, durations, started_at=clock() - 0.35)
+    spotify, poller = SpotifyHandler(sp=fake), PollScheduler(clock)
+
+    seen, last_track_id = {}, None
+    while clock() < fake.boundaries()[-1] + 5:
+        last_track_id, delay = poll_once(spotify, poller, last_track_id)
+        seen.setdefault(last_track_id, clock())
+        clock.advance(delay)
+
+    for index, boundary in enumerate(fake.boundaries()[:-1]):
+        lateness = seen[f"t{index + 1}"] - boundary
+        assert 0 <= lateness <= poll_scheduler.MIN_INTERVAL
+        latency_report("track change detection (simulated)", lateness)
+
+    stats = poller.stats()
+    assert stats["track_changes"] == len(durations) - 1
+    assert stats["detect_max_s"] <= poll_scheduler.MIN_INTERVAL
+    # Far fewer calls than polling every MIN_INTERVAL for the whole session
+    assert spotify.calls_last_hour() < sum(durations) / poll_scheduler.MIN_INTERVAL / 2
+
+def test_detection_latency_after_a_skip_counts_from_the_nudge(clock):
+    fake = FakeSpotify(clock, [200, 200])
+    spotify, poller = SpotifyHandler(sp=fake), PollScheduler(clock)
+    last_track_id, delay = poll_once(spotify, poller, None)
+    assert delay == poll_scheduler.MAX_INTERVAL
+
+    # The user skips from our UI; the poll 0.8s later sees the next track
+    poller.nudge()
+    fake.started_at -= 200 - (clock() - fake.started_at)
+    clock.advance(0.8)
+    last_track_id, delay = poll_once(spotify, poller, last_track_id)
+
+    assert last_track_id == "t1"
+    assert delay == poll_scheduler.BURST_INTERVAL
+    assert poller.stats()["detect_p50_s"] == pytest.approx(0.8)
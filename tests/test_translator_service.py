@@ -0,0 +1,239 @@
+"""TranslatorService LLM passes against a local streaming Ollama stand-in."""
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ollama
+import pytest
+
+import translator_service
+from job_control import CancelToken, JobCancelled
+from prompt_cache import PromptCache
+from translator_service import TranslatorService
+
+FEATURES_REPLY = (
+    "SINGER_GENDER: Male\n"
+    "SUBJECT_GENDER: Female\n"
+    "MOOD: Melancholic\n"
+    'KEY_PHRASES: "Streetlights bleeding into rain", "A letter never sent"\n'
+    "SETTING: Urban night\n"
+)
+VISUAL_REPLY = "VISUAL: A mystical woman made of rain walks through a neon city.\n"
+MERGED_REPLY = (
+    "MOOD: Melancholic\n"
+    "SINGER_GENDER: Male\n"
+    "SUBJECT_GENDER: Female\n"
+    'KEY_PHRASES: "Streetlights bleeding into rain", "A letter never sent"\n'
+    "SETTING: Urban night\n"
+    "VISUAL: A mystical woman made of rain walks through a neon city.\n"
+)
+# What early stopping is meant to save
+CHATTER = "I hope this helps capture the feeling of the song. Let me know if you want another take.\n"
+LYRICS = (
+    "I walk the streets alone at night and the rain is falling down on me\n"
+    "You said you would never leave but now you are gone and I know it\n"
+) * 4
+
+def tokens(text):
+    return re.findall(r"\S+\s*", text)
+
+def pass_of(prompt):
+    if "RETURN STRICTLY IN THIS FORMAT, one field per line" in prompt:
+        return "merged"
+    if "OUTPUT FORMAT (STRICT)" in prompt:
+        return "visual"
+    return "features"
+
+class FakeOllama:
+    """/api/generate streaming `replies[pass]` one token per line, as Ollama's NDJSON does."""
+    def __init__(self):
+        self.replies = {
+            "features": FEATURES_REPLY + CHATTER,
+            "visual": VISUAL_REPLY + CHATTER,
+            "merged": MERGED_REPLY + CHATTER,
+        }
+        self.token_delay = 0.005
+        self.first_token_delay = 0.05
+        self.calls = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                name = pass_of(body.get("prompt", ""))
+                fake.calls.append(name)
+                reply = tokens(fake.replies[name])
+                done = {
+                    "model": body.get("model"), "response": "", "done": True,
+                    "eval_count": len(reply), "prompt_eval_count": len(body.get("prompt", "")) // 4,
+                }
+                time.sleep(fake.first_token_delay)
+                if not body.get("stream", True):
+                    data = json.dumps(dict(done, response="".join(reply))).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for token in reply:
+                        self._line({"model": body.get("model"), "response": token, "done": False})
+                        time.sleep(fake.token_delay)
+                    self._line(done)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading early
+
+            def _line(self, obj):
+                self.wfile.write((json.dumps(obj) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class EchoTranslator:
+    def __init__(self):
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        return text
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeOllama()
+    monkeypatch.setenv("OLLAMA_HOST", fake.url)
+    # The module-level client read OLLAMA_HOST when ollama was first imported
+    monkeypatch.setattr(translator_service.ollama, "generate", ollama.Client(host=fake.url).generate)
+    yield fake
+    fake.server.shutdown()
+
+def make_service(tmp_path, **kwargs):
+    service = TranslatorService(cache=PromptCache(str(tmp_path / "prompt_cache.db")), **kwargs)
+    service.translator = EchoTranslator()
+    return service
+
+def test_two_pass_stops_after_the_last_needed_field(server, tmp_path, latency_report):
+    service = make_service(tmp_path)
+    prompt, features, _ = service.create_smart_prompt("Rain", "Band", LYRICS, ["indie"])
+
+    assert server.calls == ["features", "visual"]
+    assert prompt.startswith("A mystical woman made of rain walks through a neon city, Melancholic atmosphere")
+    assert features.endswith("SETTING: Urban night")
+    assert "I hope this helps" not in features
+    for name, reply in (("features", FEATURES_REPLY), ("visual", VISUAL_REPLY)):
+        stats = service.last_stats[name]
+        assert stats["stopped_early"]
+        # One token per streamed chunk, none of the chatter
+        assert stats["tokens"] == len(tokens(reply))
+        assert 0 < stats["first_token_s"] <= stats["latency_s"]
+        latency_report(f"llm {name} (streamed, early stop)", stats["latency_s"])
+
+def test_merged_mode_makes_one_call(server, tmp_path, latency_report):
+    service = make_service(tmp_path, merged=True)
+    prompt, features, _ = service.create_smart_prompt("Rain", "Band", LYRICS, ["indie"])
+
+    assert server.calls == ["merged"]
+    assert prompt.startswith("A mystical woman made of rain walks through a neon city, Melancholic atmosphere")
+    assert "I hope this helps" not in features
+    stats = service.last_stats["merged"]
+    assert stats["stopped_early"]
+    assert stats["tokens"] == len(tokens(MERGED_REPLY))
+    assert "features" not in service.last_stats and "visual" not in service.last_stats
+    latency_report("llm merged (streamed, early stop)", stats["latency_s"])
+
+def test_early_stop_saves_time_over_the_full_reply(server, tmp_path):
+    server.token_delay = 0.02
+    service = make_service(tmp_path, merged=True)
+    service.create_smart_prompt("Rain", "Band", LYRICS, [])
+    full = server.first_token_delay + len(tokens(MERGED_REPLY + CHATTER)) * server.token_delay
+    assert service.last_stats["merged"]["latency_s"] < full - len(tokens(CHATTER)) * server.token_delay / 2
+
+def test_done_helpers_need_a_complete_line():
+    assert not translator_service._features_done("MOOD: Dreamy\nSETTING: Urb")
+    assert translator_service._features_done("MOOD: Dreamy\nSETTING: Urban night\n")
+    assert not translator_service._visual_done("VISUAL:\n")
+    assert not translator_service._merged_done("VISUAL: Rain at night\n")
+    assert translator_service._merged_done("MOOD: Dreamy\nVISUAL: Rain at night\n")
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_partial_output_falls_back_per_field(server, tmp_path, merged):
+    # The model stops before VISUAL: the stream ends normally without the last field
+    server.replies = {
+        "features": "MOOD: Euphoric\nSINGER_GENDER: Female\n",
+        "visual": "Here is a scene of dancing lights",
+        "merged": "MOOD: Euphoric\nSINGER_GENDER: Female\n",
+    }
+    service = make_service(tmp_path, merged=merged)
+    prompt, _, _ = service.create_smart_prompt("Lights", "Band", LYRICS, [])
+
+    assert prompt.startswith("Abstract cinematic dream, Euphoric atmosphere")
+    for name in (("merged",) if merged else ("features", "visual")):
+        stats = service.last_stats[name]
+        assert not stats["stopped_early"]
+        # Counts come from the final done chunk
+        assert stats["tokens"] == len(tokens(server.replies[name]))
+        assert stats["prompt_tokens"] > 0
+    if merged:
+        # An incomplete merged answer is not cached, so the next call retries
+        service.create_smart_prompt("Lights", "Band", LYRICS, [])
+        assert server.calls == ["merged", "merged"]
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_non_streaming_reports_model_counts(server, tmp_path, merged):
+    service = make_service(tmp_path, stream=False, merged=merged)
+    prompt, _, _ = service.create_smart_prompt("Rain", "Band", LYRICS, [])
+
+    assert prompt.startswith("A mystical woman made of rain walks through a neon city, Melancholic atmosphere")
+    for name in (("merged",) if merged else ("features", "visual")):
+        stats = service.last_stats[name]
+        assert not stats["stopped_early"]
+        assert stats["first_token_s"] is None
+        assert stats["tokens"] == len(tokens(server.replies[name]))
+
+def test_second_song_hits_the_cache(server, tmp_path):
+    service = make_service(tmp_path)
+    first, _, _ = service.create_smart_prompt("Rain", "Band", LYRICS, ["indie"])
+    second, _, _ = service.create_smart_prompt("Rain", "Band", LYRICS, ["indie"])
+
+    assert first == second
+    assert server.calls == ["features", "visual"]
+    assert service.last_stats["features"] == {"cached": True}
+    assert service.last_stats["visual"] == {"cached": True}
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_unreachable_ollama_is_reported_as_fallback(server, tmp_path, monkeypatch, merged):
+    monkeypatch.setattr(translator_service.ollama, "generate", ollama.Client(host="http://127.0.0.1:1").generate)
+    service = make_service(tmp_path, merged=merged)
+    service.create_smart_prompt("Rain", "Band", LYRICS, [])
+
+    assert service.fallback_passes() == (["merged"] if merged else ["features", "visual"])
+    # Fallbacks are not cached: the next song retries the model
+    monkeypatch.setattr(translator_service.ollama, "generate", ollama.Client(host=server.url).generate)
+    service.create_smart_prompt("Rain", "Band", LYRICS, [])
+    assert service.fallback_passes() == []
+
+def test_cancel_stops_the_stream(server, tmp_path):
+    server.token_delay = 0.05
+    service = make_service(tmp_path)
+    token = CancelToken()
+    threading.Timer(server.first_token_delay + 0.1, token.cancel).start()
+
+    start = time.perf_counter()
+    with pytest.raises(JobCancelled):
+        service.create_smart_prompt("Rain", "Band", LYRICS, [], cancel_token=token)
+    assert time.perf_counter() - start < 1.0
+    assert server.calls == ["features"]
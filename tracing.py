@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Enable with TRACE=1 in .env. Spans go to TRACE_LOG (JSON lines) and are
+# served in Prometheus text format on localhost:METRICS_PORT/metrics.
+TRACE_LOG = "traces.jsonl"
+METRICS_PORT = 9464
+SAMPLES_PER_STAGE = 1000
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    def __init__(self, tracer, stage, job):
+        self.tracer = tracer
+        self.stage = stage
+        self.job = job
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        status = "ok" if exc_type is None else exc_type.__name__
+        self.tracer.record({
+            "kind": "span", "stage": self.stage, "job": self.job, "ts": time.time(),
+            "seconds": time.perf_counter() - self.start, "status": status,
+        })
+        return False
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+class Tracer:
+    """
+    Per-job stage spans, event counters and gauges for the art pipeline.
+    Disabled, every call returns after one attribute check.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.sink = None       # render worker: forwards records to the GUI process
+        self._log = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stages = {}       # stage -> deque of seconds
+        self.stage_totals = {} # stage -> [count, sum]
+        self.counters = {}     # (name, labels) -> n
+        self.gauges = {}       # name -> value
+
+    def configure(self, enabled=None, log_path=TRACE_LOG, port=METRICS_PORT, sink=None):
+        """GUI: log file + metrics endpoint. Worker: pass sink instead and neither is opened."""
+        if enabled is None:
+            enabled = os.getenv("TRACE") == "1"
+        self.enabled = enabled
+        self.sink = sink
+        if not enabled or sink:
+            return
+        if log_path:
+            self._log = open(log_path, "a", encoding="utf-8")
+        if port:
+            self._serve(port)
+
+    # --- instrumentation API ---
+    def job(self, job_id):
+        """Context manager tagging spans on this thread with a job (track) id."""
+        return _JobScope(self, job_id)
+
+    def span(self, stage):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage, getattr(self._local, "job", None))
+
+    def count(self, name, **labels):
+        if self.enabled:
+            self.record({"kind": "count", "name": name, "labels": labels,
+                         "job": getattr(self._local, "job", None), "ts": time.time()})
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.record({"kind": "gauge", "name": name, "value": value, "ts": time.time()})
+
+    # --- collection ---
+    def record(self, rec):
+        if self.sink:
+            self.sink(rec)
+            return
+        with self._lock:
+            if rec["kind"] == "span":
+                self.stages.setdefault(rec["stage"], deque(maxlen=SAMPLES_PER_STAGE)).append(rec["seconds"])
+                totals = self.stage_totals.setdefault(rec["stage"], [0, 0.0])
+                totals[0] += 1
+                totals[1] += rec["seconds"]
+            elif rec["kind"] == "count":
+                key = (rec["name"], tuple(sorted(rec["labels"].items())))
+                self.counters[key] = self.counters.get(key, 0) + 1
+            else:
+                self.gauges[rec["name"]] = rec["value"]
+            if self._log and rec["kind"] != "gauge":
+                self._log.write(json.dumps(rec) + "\n")
+                self._log.flush()
+
+    def summary(self):
+        """{stage: (count, p50, p95)} in seconds."""
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self.stages.items()}
+        return {
+            stage: (len(values), _quantile(values, 0.5), _quantile(values, 0.95))
+            for stage, values in snapshot.items() if values
+        }
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        if not summary:
+            return
+        print("📊 Stage latency (p50 / p95):")
+        for stage, (count, p50, p95) in sorted(summary.items()):
+            print(f"   {stage:<14} {count:>5}x  {p50 * 1000:>8.0f}ms  {p95 * 1000:>8.0f}ms")
+
+    def prometheus_text(self):
+        lines = ["# TYPE art_stage_seconds summary"]
+        summary = self.summary()
+        with self._lock:
+            totals = dict(self.stage_totals)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        for stage, (_, p50, p95) in sorted(summary.items()):
+            lines.append(f'art_stage_seconds{{stage="{stage}",quantile="0.5"}} {p50:.6f}')
+            lines.append(f'art_stage_seconds{{stage="{stage}",quantile="0.95"}} {p95:.6f}')
+            lines.append(f'art_stage_seconds_sum{{stage="{stage}"}} {totals[stage][1]:.6f}')
+            lines.append(f'art_stage_seconds_count{{stage="{stage}"}} {totals[stage][0]}')
+        lines.append("# TYPE art_events_total counter")
+        for (name, labels), n in sorted(counters.items()):
+            label_str = ",".join([f'name="{name}"'] + [f'{k}="{v}"' for k, v in labels])
+            lines.append(f"art_events_total{{{label_str}}} {n}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE art_{name} gauge")
+            lines.append(f"art_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _serve(self, port):
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        except OSError as e:
+            print(f"Metrics endpoint not started: {e}")
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"📊 Metrics on http://127.0.0.1:{port}/metrics")
+
+class _JobScope:
+    def __init__(self, tracer, job_id):
+        self.tracer = tracer
+        self.job_id = job_id
+
+    def __enter__(self):
+        self.previous = getattr(self.tracer._local, "job", None)
+        self.tracer._local.job = self.job_id
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._local.job = self.previous
+        return False
+
+# Process-wide instance; call tracer.configure() once at start-up
+tracer = Tracer()
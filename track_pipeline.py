@@ -0,0 +1,308 @@
+import time
+import threading
+
+from prefetch_scheduler import PrefetchScheduler, PRIORITY_CURRENT, PRIORITY_PREFETCH
+from job_control import CancelToken, JobCancelled, check
+from render_profiles import fit_long_edge
+from quality_scheduler import QualityScheduler, remaining_ms, REFINE_STRENGTH
+from render_worker import RenderClient, WorkerCrashed
+from poll_scheduler import PollScheduler
+from tracing import tracer
+
+# How many upcoming queue tracks get their art rendered ahead of time
+PREFETCH_DEPTH = 3
+# Show a rough preview of the art every N diffusion steps (0 = off)
+PREVIEW_EVERY = 3
+# Target seconds for one diffusion render when the track length is unknown;
+# otherwise QualityScheduler sizes the render from the time left in the track
+GENERATION_BUDGET_S = 45
+
+class TrackPipeline:
+    """
+    Everything between a Spotify poll and art being shown, without Tk: the poll
+    loop, track changes, prefetching, translation warm-up and the lyrics ->
+    prompt -> render jobs on the render worker.
+
+    The view (SpotifyAIApp, or the headless one in benchmarks/offline_e2e.py)
+    provides preview_channel, display_size, update_info(title, artist),
+    update_image_display(image_path_or_url, is_url=False) and set_playing(flag).
+    """
+    def __init__(self, view, spotify, lyrics_engine, art_store, screen_size, services=None, started_at=None):
+        self.view = view
+        self.spotify = spotify
+        self.lyrics_engine = lyrics_engine
+        self.art_store = art_store
+        self.screen_width, self.screen_height = screen_size
+        self.started_at = time.perf_counter() if started_at is None else started_at
+
+        self.running = True
+        self.current_track_id = None
+        self.current_timeline = None
+        self.last_track_id = None
+        self.last_poll = None
+        self.first_track_shown = False
+        self.warm_token = None
+        self.quality = None
+        self.poller = PollScheduler()
+
+        # LLM + diffusion in a separate process, so a crash or OOM there never takes
+        # the display down and its work does not compete for our GIL. Only the
+        # process is spawned here; the models load in the background.
+        self.render_client = RenderClient(
+            preview_channel=view.preview_channel, preview_every=PREVIEW_EVERY, on_ready=self.on_models_ready,
+            services=services
+        )
+        # Jobs can be queued right away; they wait in render_track until the models load
+        self.scheduler = PrefetchScheduler(self.render_track, on_done=self.on_art_ready)
+
+    def stop(self):
+        self.running = False
+        self.scheduler.stop()
+        self.render_client.stop()
+        self.poller.wake.set()
+
+    def on_models_ready(self, profile):
+        # Called again after every worker restart; the learned cost model is kept
+        if self.quality is None:
+            self.quality = QualityScheduler(profile)
+            print(f"⏱ Models ready after {time.perf_counter() - self.started_at:.2f}s")
+
+    # --- POLLING ---
+    def main_loop(self):
+        while self.running:
+            self.poller.wait(self.poll())
+
+    def poll(self):
+        """One Spotify poll; handles a track change and returns the seconds until the next poll."""
+        try:
+            current = self.spotify.get_current_track()
+            if current:
+                self.view.set_playing(current.get('is_playing', False))
+
+                if current['id'] != self.last_track_id:
+                    self.last_track_id = current['id']
+                    self.poller.on_track_change()
+                    self.handle_track_change(current)
+
+            self.last_poll = current
+            # Rare mid-song, dense near the predicted end of the track or after a control action
+            return self.poller.next_delay(current)
+        except Exception as e:
+            print(f"Loop error: {e}")
+            retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+            return self.poller.on_error(retry_after)
+
+    def print_poll_stats(self):
+        stats = self.poller.stats()
+        calls = self.spotify.calls_last_hour()
+        if stats["track_changes"]:
+            print(f"📡 Spotify: {calls} API calls in the last hour | track change seen after "
+                  f"p50 {stats['detect_p50_s']:.1f}s, max {stats['detect_max_s']:.1f}s")
+        else:
+            print(f"📡 Spotify: {calls} API calls in the last hour")
+
+    # --- TRACK CHANGES ---
+    def handle_track_change(self, track):
+        self.current_track_id = track['id']
+        self.current_timeline = None
+        self.scheduler.supersede(track['id'])
+        if self.warm_token:
+            self.warm_token.cancel()  # the old queue's translations must not delay this track
+        self.view.update_info(track['title'], track['artist'])
+        self.load_timeline(track)
+
+        # 1. Show Official Album Art first (Instant feedback)
+        if track.get('album_art'):
+            self.view.update_image_display(track['album_art'], is_url=True)
+        if not self.first_track_shown:
+            self.first_track_shown = True
+            print(f"⏱ First track displayed after {time.perf_counter() - self.started_at:.2f}s")
+
+        # 2. Check if AI Art exists (it usually does if the track was prefetched).
+        # One lookup, no separate has(): the art may be evicted in between.
+        path = self.art_store.lookup(track['id'], self.view.display_size)
+        if path is not None:
+            # Stored at (or cheaply rescaled to) the current display size
+            self.view.update_image_display(path)
+        else:
+            # 3. Generate New Art, ahead of any prefetch work
+            self.scheduler.submit(track, priority=PRIORITY_CURRENT)
+
+        self.prefetch_queue()
+
+    def load_timeline(self, track):
+        def _on_lyrics(fut, t_id=track['id']):
+            timeline = self.lyrics_engine.get_timeline(t_id)
+            if t_id == self.current_track_id:
+                self.current_timeline = timeline
+        self.lyrics_engine.fetch_async(track).add_done_callback(_on_lyrics)
+
+    def prefetch_queue(self):
+        """Renders art for the next tracks in the Spotify queue in the background."""
+        upcoming = self.spotify.get_queue(limit=PREFETCH_DEPTH)
+        self.scheduler.drop_prefetch()
+        for i, track in enumerate(upcoming):
+            if track['id'] == self.current_track_id or self.art_store.has(track['id']):
+                continue
+            self.scheduler.submit(track, priority=PRIORITY_PREFETCH + i)
+        if self.warm_token:
+            self.warm_token.cancel()
+        self.warm_token = CancelToken()
+        threading.Thread(target=self.warm_translations, args=(upcoming, self.warm_token), daemon=True).start()
+
+    def warm_translations(self, upcoming, cancel_token):
+        """
+        Translates the queued tracks' lyrics in one batch, ahead of their prompt
+        jobs. Runs beside (not ahead of) the worker's render jobs and is cancelled
+        on the next track change.
+        """
+        pending = [t for t in upcoming if not self.art_store.has(t['id'])]
+        if not pending or not self.render_client.ready.is_set():
+            return
+        lyrics = self.lyrics_engine.get_lyrics_for_queue(None, pending)["queue"]
+        texts = [text for text in lyrics.values() if text]
+        if texts and not cancel_token.cancelled:
+            try:
+                self.render_client.translate_batch(texts, cancel_token=cancel_token)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                print(f"Translation prefetch error: {e}")
+
+    def on_art_ready(self, track, art):
+        # Prefetched art is only shown once its track starts playing.
+        # `art` is a frame straight from the render worker, or a path for cached art.
+        if track['id'] == self.current_track_id:
+            self.view.preview_channel.clear()  # a late preview must not replace the final art
+            self.view.update_image_display(art)
+
+    # --- RENDERING (scheduler thread) ---
+    def render_track(self, track, cancel_token=None):
+        """Runs lyrics -> prompt -> diffusion for one track. Called on the scheduler thread."""
+        path = self.art_store.lookup(track['id'], self.view.display_size)
+        if path is not None:
+            tracer.count("cache", stage="art", result="hit")
+            return path
+        tracer.count("cache", stage="art", result="miss")
+        # Jobs queue until the worker has its models loaded
+        try:
+            self.render_client.wait_ready(cancel_token)
+        except WorkerCrashed as e:
+            print(f"Generation Failed: {e}")
+            return None
+        return self.generate_new_art(track, cancel_token)
+
+    def generate_new_art(self, track, cancel_token=None):
+        # Fetch Lyrics (simplified)
+        try:
+            with tracer.span("lyrics"):
+                lyrics = self.lyrics_engine.get_lyrics_for_queue(track, []).get("current", "")
+        except: lyrics = ""
+        check(cancel_token)
+
+        # With synced lyrics, describe the section around the playback position
+        timeline = self.lyrics_engine.get_timeline(track['id'])
+        if timeline:
+            lyrics = timeline.section_around(track.get('progress_ms', 0)) or lyrics
+
+        if not lyrics:
+            genres = track.get("genres", [])
+            lyrics = f"{track['title']} {' '.join(genres) if genres else ''}"
+
+        try:
+            # Get Prompt
+            with tracer.span("prompt"):
+                prompt = self.render_client.prompt(track, lyrics, cancel_token=cancel_token)
+            check(cancel_token)
+        except WorkerCrashed as e:
+            print(f"Generation Failed: {e}")
+            return None
+
+        # --- DYNAMIC RESOLUTION / DEADLINE-AWARE QUALITY ---
+        plan = None
+        left_s = remaining_ms(track, time.time()) / 1000
+        if left_s:
+            plan = self.quality.plan(left_s, self.screen_long_ratio())
+            print(f"⏳ {left_s:.0f}s left | {plan['steps']} steps, strength {plan['strength']}, "
+                  f"~{plan['estimate_s']:.0f}s{' + refine' if plan['refine'] else ''}")
+            gen_w, gen_h = self.calculate_generation_dims(long_edge=plan["long_edge"])
+        else:
+            gen_w, gen_h = self.calculate_generation_dims()
+
+        try:
+            with tracer.span("render"):
+                frame, timing = self.render_client.render(
+                    prompt,
+                    track,
+                    width=gen_w,
+                    height=gen_h,
+                    steps=plan["steps"] if plan else None,
+                    strength=plan["strength"] if plan else 0.85,
+                    cancel_token=cancel_token
+                )
+            self.record_step_timing(timing)
+
+            if plan and plan["refine"]:
+                # Show the quick version now, then upscale it with the time left over
+                self.on_art_ready(track, frame)
+                full_w, full_h = self.calculate_generation_dims(long_edge=self.render_client.profile["long_edge"])
+                with tracer.span("refine"):
+                    frame, timing = self.render_client.refine(
+                        prompt, track, full_w, full_h, strength=REFINE_STRENGTH, cancel_token=cancel_token
+                    )
+                self.record_step_timing(timing)
+            return frame
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Generation Failed: {e}")
+            return None
+
+    def record_step_timing(self, t):
+        if t:
+            self.quality.cost_model.observe(self.render_client.profile, t["steps"], t["width"], t["height"], t["seconds"])
+
+    def screen_long_ratio(self):
+        screen_ratio = self.screen_width / self.screen_height
+        return max(screen_ratio, 1 / screen_ratio)
+
+    def calculate_generation_dims(self, budget_s=GENERATION_BUDGET_S, long_edge=None):
+        """
+        Calculates optimal generation dimensions based on screen aspect ratio.
+        Stable Diffusion works best around 512-1024px.
+        We scale the resolution down to keep the ratio but save GPU time.
+        """
+        screen_ratio = self.screen_width / self.screen_height
+
+        # Base size for the long edge (Higher = sharper but slower)
+        # The render profile caps it (1024 on CUDA) and the latency budget can lower it.
+        if long_edge is None:
+            long_edge = fit_long_edge(self.render_client.profile, self.screen_long_ratio(), budget_s)
+
+        if screen_ratio > 1: # Landscape
+            width = long_edge
+            height = int(long_edge / screen_ratio)
+        else: # Portrait
+            height = long_edge
+            width = int(long_edge * screen_ratio)
+
+        # Dimensions must be multiples of 8 for Stable Diffusion
+        width = (width // 8) * 8
+        height = (height // 8) * 8
+
+        print(f"📏 Screen: {self.screen_width}x{self.screen_height} | Generating at: {width}x{height} (Ratio Preserved)")
+        return width, height
+
+    # --- Controls ---
+    def toggle_play(self, is_playing):
+        if is_playing: self.spotify.pause_playback()
+        else: self.spotify.start_playback()
+        self.poller.nudge()
+
+    def next_track(self):
+        self.spotify.next_track()
+        self.poller.nudge()
+
+    def prev_track(self):
+        self.spotify.previous_track()
+        self.poller.nudge()
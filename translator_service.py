@@ -3,19 +3,234 @@ from deep_translator import GoogleTranslator
 from datetime import datetime
 import re
 import json
+import time
+
+from prompt_cache import PromptCache, content_key
+from job_control import JobCancelled, check
+from tracing import tracer
+
+# Bump when a prompt template below changes; only that pass's cache entries go stale
+FEATURES_TEMPLATE_VERSION = 1
+VISUAL_TEMPLATE_VERSION = 1
+MERGED_TEMPLATE_VERSION = 1
+FEATURES_TEMPERATURE = 0.3
+VISUAL_TEMPERATURE = 0.8
+TRANSLATE_TARGET = "en"
+# Only this much of the lyrics reaches the LLM passes, so only this much is translated
+SNIPPET_CHARS = 1200
+# Missing lines are sent joined by newlines, at most this many characters per request (API limit 5000)
+TRANSLATE_CHUNK_CHARS = 4500
+# Starting guess for one translation round trip; replaced by measurements
+TRANSLATE_CALL_S = 0.5
+ENGLISH_WORDS = frozenset(
+    "the a an and or but i you he she it we they me my your our his her their is are was were be been am "
+    "do does did don't not no to of in on at for with from by this that what when where who how all so if "
+    "just like love oh yeah can can't i'm you're it's will would never know now".split()
+)
+
+def is_english(text):
+    """Cheap local guess: English lyrics are plain ASCII and dense in English function words."""
+    words = re.findall(r"[^\W\d_]+(?:'[^\W\d_]+)?", text.lower())
+    if len(words) < 8:
+        return False  # too little to tell; translating is the safe choice
+    if sum(not w.isascii() for w in words) > len(words) * 0.05:
+        return False
+    return sum(w in ENGLISH_WORDS for w in words) >= len(words) * 0.25
+
+def used_lines(lyrics, limit=SNIPPET_CHARS):
+    """Leading lines of the lyrics up to `limit` characters: the part the LLM passes see."""
+    lines, total = [], 0
+    for line in lyrics.splitlines():
+        if total >= limit:
+            break
+        lines.append(line)
+        total += len(line) + 1
+    return lines
+
+def _needs_translation(segment):
+    return re.search(r"[^\W\d_]", segment) is not None
+
+def _chunks(segments, limit=TRANSLATE_CHUNK_CHARS):
+    chunk, size = [], 0
+    for segment in segments:
+        if chunk and size + len(segment) + 1 > limit:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(segment)
+        size += len(segment) + 1
+    if chunk:
+        yield chunk
+
+def _has_field(text, field):
+    """True once a complete 'FIELD: value' line has been streamed (newline seen)."""
+    return re.search(rf"^\s*{field}:[ \t]*\S.*\n", text, re.IGNORECASE | re.MULTILINE) is not None
+
+def _features_done(text):
+    # SETTING is the last field of the pass 1 format
+    return _has_field(text, "SETTING")
+
+def _visual_done(text):
+    return _has_field(text, "VISUAL")
+
+def _merged_done(text):
+    return _has_field(text, "MOOD") and _has_field(text, "VISUAL")
 
 class TranslatorService:
-    def __init__(self):
-        self.translator = GoogleTranslator(source='auto', target='en')
+    def __init__(self, cache=None, stream=True, merged=False):
+        self.translator = GoogleTranslator(source='auto', target=TRANSLATE_TARGET)
         self.model = "llama3.2" 
+        # Translation and both LLM passes are cached separately by content hash
+        self.cache = cache or PromptCache()
+        # stream: stop generating once the needed fields are parsed
+        # merged: one structured call instead of features + visual passes
+        self.stream = stream
+        self.merged = merged
+        self.last_stats = {}
+        # Across songs: translation requests made, and time saved against one request per song
+        self.translate_totals = {"songs": 0, "calls": 0, "skipped_english": 0, "saved_s": 0.0}
+        self.call_s = TRANSLATE_CALL_S
+
+    def _generate(self, pass_name, prompt, temperature, done_when=None, cancel_token=None):
+        """Runs one Ollama call and records token count and latency for it in last_stats."""
+        with tracer.span(f"llm_{pass_name}"):
+            text, stats = self._generate_timed(prompt, temperature, done_when, cancel_token)
+        self.last_stats[pass_name] = stats
+        return text
+
+    def _generate_timed(self, prompt, temperature, done_when, cancel_token):
+        start = time.perf_counter()
+        stats = {"tokens": 0, "prompt_tokens": 0, "first_token_s": None, "stopped_early": False}
+
+        if not self.stream:
+            response = ollama.generate(
+                model=self.model, prompt=prompt, stream=False, options={"temperature": temperature}
+            )
+            text = response["response"]
+            stats["tokens"] = response.get("eval_count") or 0
+            stats["prompt_tokens"] = response.get("prompt_eval_count") or 0
+        else:
+            text = ""
+            chunks = ollama.generate(
+                model=self.model, prompt=prompt, stream=True, options={"temperature": temperature}
+            )
+            try:
+                for chunk in chunks:
+                    check(cancel_token)
+                    if stats["first_token_s"] is None:
+                        stats["first_token_s"] = time.perf_counter() - start
+                    text += chunk["response"]
+                    stats["tokens"] += 1
+                    if chunk.get("done"):
+                        stats["tokens"] = chunk.get("eval_count") or stats["tokens"]
+                        stats["prompt_tokens"] = chunk.get("prompt_eval_count") or 0
+                        break
+                    if done_when and done_when(text):
+                        stats["stopped_early"] = True
+                        break
+            finally:
+                # Closing the stream drops the connection, which makes Ollama stop generating
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+
+        stats["latency_s"] = time.perf_counter() - start
+        return text.strip(), stats
+
+    def _translate(self, lyrics):
+        """
+        English version of the part of the lyrics the LLM passes use. English
+        songs are not sent at all; otherwise each distinct line is translated
+        once and cached by content hash, so repeated choruses and songs that
+        share lines cost nothing.
+        """
+        lines = used_lines(lyrics)
+        stats = {"lines": len(lines), "cached": 0, "repeats": 0, "calls": 0, "skipped": False, "latency_s": 0.0}
+        self.last_stats["translate"] = stats
+        self.translate_totals["songs"] += 1
+        if is_english("\n".join(lines)):
+            stats["skipped"] = True
+            self.translate_totals["skipped_english"] += 1
+            self.translate_totals["saved_s"] += self.call_s
+            return "\n".join(lines)
+
+        translated = self._translate_segments([line.strip() for line in lines], stats)
+        # Before segmenting, every song cost exactly one request
+        self.translate_totals["saved_s"] += (1 - stats["calls"]) * self.call_s
+        return "\n".join(translated.get(line.strip(), line) for line in lines)
+
+    def translate_batch(self, texts, cancel_token=None):
+        """
+        Translates the used part of several songs (e.g. the queued tracks) in
+        shared requests, so their prompts later find every line cached.
+        Returns the number of requests made.
+        """
+        segments = []
+        for text in texts:
+            lines = used_lines(text)
+            if not is_english("\n".join(lines)):
+                segments.extend(line.strip() for line in lines)
+        stats = {"cached": 0, "repeats": 0, "calls": 0, "latency_s": 0.0}
+        self._translate_segments(segments, stats, cancel_token)
+        self.translate_totals["saved_s"] -= stats["calls"] * self.call_s
+        return stats["calls"]
+
+    def _translate_segments(self, segments, stats, cancel_token=None):
+        """{segment: english} for every segment; only uncached distinct ones are sent."""
+        wanted = [s for s in segments if _needs_translation(s)]
+        unique = list(dict.fromkeys(wanted))
+        stats["repeats"] += len(wanted) - len(unique)
+
+        result, missing = {}, []
+        for segment in unique:
+            cached = self.cache.get("translate", content_key(segment, TRANSLATE_TARGET))
+            if cached is not None:
+                result[segment] = cached
+                stats["cached"] += 1
+            else:
+                missing.append(segment)
+
+        for chunk in _chunks(missing):
+            check(cancel_token)
+            start = time.perf_counter()
+            try:
+                with tracer.span("translate"):
+                    parts = (self.translator.translate("\n".join(chunk)) or "").split("\n")
+                    if len(parts) != len(chunk):
+                        # Lines were merged or split; fall back to one request per line
+                        parts = [self.translator.translate(segment) or segment for segment in chunk]
+                        stats["calls"] += len(chunk)
+            except Exception as e:
+                print(f"Translation error: {e}")
+                continue  # left untranslated and uncached, so the next song retries
+            finally:
+                stats["calls"] += 1
+                elapsed = time.perf_counter() - start
+                stats["latency_s"] += elapsed
+                self.call_s += 0.3 * (elapsed - self.call_s)
+
+            for segment, english in zip(chunk, parts):
+                english = english.strip()
+                if english:
+                    result[segment] = english
+                    self.cache.put("translate", content_key(segment, TRANSLATE_TARGET), english)
+
+        self.translate_totals["calls"] += stats["calls"]
+        return result
 
     # -------- PASS 1: FEATURE & PHRASE EXTRACTION --------
-    def _extract_song_features(self, title, artist, lyrics, genres_list):
+    def _extract_song_features(self, title, artist, lyrics, genres_list, cancel_token=None):
         """
         Extracts structured data, focusing on meaningful lyrical phrases.
         """
-        snippet = lyrics[:1200]
+        snippet = lyrics[:SNIPPET_CHARS]
         genres_str = ", ".join(genres_list) if genres_list else "Unknown Genre"
+        key = content_key(
+            title, artist, snippet, genres_list, self.model, FEATURES_TEMPERATURE, FEATURES_TEMPLATE_VERSION
+        )
+        cached = self.cache.get("features", key)
+        if cached is not None:
+            self.last_stats["features"] = {"cached": True}
+            return cached
 
         prompt = f"""
 Analyze the song "{title}" by "{artist}".
@@ -32,19 +247,27 @@ SETTING: (e.g. Urban night, Forest, Void, Bedroom)
 """
         try:
             # Low temperature for precise extraction
-            response = ollama.generate(
-                model=self.model, prompt=prompt, stream=False, options={"temperature": 0.3}
-            )
-            return response["response"].strip()
+            features = self._generate("features", prompt, FEATURES_TEMPERATURE, _features_done, cancel_token)
+            self.cache.put("features", key, features)
+            return features
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Ollama Error (Features): {e}")
+            self.last_stats["features"] = {"fallback": True, "error": str(e)}
             return "SINGER_GENDER: Unknown\nSUBJECT_GENDER: Unknown\nMOOD: Dreamy\nKEY_PHRASES: Lost in the music\nSETTING: Void"
 
     # -------- PASS 2: VISUAL SYNTHESIS --------
-    def _generate_cinematic_prompt(self, features):
+    def _generate_cinematic_prompt(self, features, cancel_token=None):
         """
         Converts the specific lyric phrases into a cohesive visual description.
         """
+        key = content_key(features, self.model, VISUAL_TEMPERATURE, VISUAL_TEMPLATE_VERSION)
+        cached = self.cache.get("visual", key)
+        if cached is not None:
+            self.last_stats["visual"] = {"cached": True}
+            return cached
+
         prompt = f"""
 You are an expert AI Art Director.
 DATA:
@@ -63,27 +286,80 @@ VISUAL: [A single sentence describing the scene, max 20 words]
 """
         try:
             # Higher temperature to creatively blend the phrases
-            response = ollama.generate(
-                model=self.model, prompt=prompt, stream=False, options={"temperature": 0.8}
-            )
-            return response["response"].strip()
+            visual = self._generate("visual", prompt, VISUAL_TEMPERATURE, _visual_done, cancel_token)
+            self.cache.put("visual", key, visual)
+            return visual
+        except JobCancelled:
+            raise
         except Exception as e:
+            print(f"Ollama Error (Visual): {e}")
+            self.last_stats["visual"] = {"fallback": True, "error": str(e)}
             return "VISUAL: A blurred silhouette wandering through a dream"
 
-    # -------- MAIN METHOD --------
-    def create_smart_prompt(self, title, artist, full_lyrics, genres):
-        # 1. Translate
+    # -------- SINGLE PASS: FEATURES + VISUAL --------
+    def _generate_merged(self, title, artist, lyrics, genres_list, cancel_token=None):
+        """
+        One structured call returning the pass 1 fields followed by VISUAL.
+        Returns whatever fields were produced; the caller falls back per field.
+        """
+        snippet = lyrics[:SNIPPET_CHARS]
+        genres_str = ", ".join(genres_list) if genres_list else "Unknown Genre"
+        key = content_key(
+            title, artist, snippet, genres_list, self.model, FEATURES_TEMPERATURE, MERGED_TEMPLATE_VERSION
+        )
+        cached = self.cache.get("merged", key)
+        if cached is not None:
+            self.last_stats["merged"] = {"cached": True}
+            return cached
+
+        prompt = f"""
+You are an expert AI Art Director. Analyze the song "{title}" by "{artist}".
+Genres: {genres_str}
+Lyrics Snippet: "{snippet}..."
+
+TASK: Pick the most visual METAPHORICAL SENTENCES and turn them into one cinematic scene.
+OPPOSITE GENDER RULE: Male singer about a woman -> mystical FEMALE figure; Female singer about a man -> mystical MALE figure; otherwise no humans, visualize the setting abstractly.
+STYLE: Blurry, Cinematic, Emotional, Ethereal.
+
+RETURN STRICTLY IN THIS FORMAT, one field per line, in this order:
+MOOD: (e.g. Melancholic, Euphoric, Aggressive, Dreamy)
+SINGER_GENDER: (Male / Female / Unknown)
+SUBJECT_GENDER: (Male / Female / Unknown / None)
+KEY_PHRASES: (3 short, vivid phrases from the lyrics)
+SETTING: (e.g. Urban night, Forest, Void, Bedroom)
+VISUAL: [A single sentence describing the scene, max 20 words]
+"""
         try:
-            en_lyrics = self.translator.translate(full_lyrics[:2000])
-        except:
-            en_lyrics = full_lyrics
+            merged = self._generate("merged", prompt, FEATURES_TEMPERATURE, _merged_done, cancel_token)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Ollama Error (Merged): {e}")
+            self.last_stats["merged"] = {"fallback": True, "error": str(e)}
+            return ""
+        if _has_field(merged + "\n", "VISUAL"):
+            self.cache.put("merged", key, merged)
+        return merged
+
+    # -------- MAIN METHOD --------
+    def create_smart_prompt(self, title, artist, full_lyrics, genres, cancel_token=None):
+        # Each finished stage is cached, so a cancelled job resumes where it stopped
+        self.last_stats = {}
+        # 1. Translate (only the part the passes below use)
+        en_lyrics = self._translate(full_lyrics)
+        check(cancel_token)
 
-        # 2. EXTRACT FEATURES (Pass 1)
         print(f"🧠 Analyzing features for '{title}'...")
-        features_raw = self._extract_song_features(title, artist, en_lyrics, genres)
-        
-        # 3. GENERATE VISUAL (Pass 2)
-        visual_raw = self._generate_cinematic_prompt(features_raw)
+        if self.merged:
+            # 2+3. Features and visual in one call; missing fields fall back below
+            features_raw = visual_raw = self._generate_merged(title, artist, en_lyrics, genres, cancel_token)
+        else:
+            # 2. EXTRACT FEATURES (Pass 1)
+            features_raw = self._extract_song_features(title, artist, en_lyrics, genres, cancel_token)
+            check(cancel_token)
+
+            # 3. GENERATE VISUAL (Pass 2)
+            visual_raw = self._generate_cinematic_prompt(features_raw, cancel_token)
 
         # 4. Parse & Assemble
         visual_desc = "Abstract cinematic dream"
@@ -111,6 +387,31 @@ VISUAL: [A single sentence describing the scene, max 20 words]
         print(f"TRACK: {title}")
         print(f"EXTRACTED DATA:\n{features_raw}")
         print(f"GENERATED VISUAL: {visual_desc}")
-        print(f"FINAL PROMPT: {final_prompt}\n")
+        print(f"FINAL PROMPT: {final_prompt}")
+        for pass_name, stats in self.last_stats.items():
+            if pass_name == "translate":
+                self._print_translate_stats(stats)
+            elif stats.get("cached"):
+                print(f"LLM {pass_name}: cached")
+            elif stats.get("fallback"):
+                print(f"LLM {pass_name}: failed, canned fallback used")
+            else:
+                early = ", stopped early" if stats["stopped_early"] else ""
+                print(f"LLM {pass_name}: {stats['tokens']} tokens in {stats['latency_s']:.2f}s{early}")
+        print()
+
+        return final_prompt, features_raw, en_lyrics
+
+    def fallback_passes(self):
+        """LLM passes of the last create_smart_prompt that failed and returned canned text instead."""
+        return [name for name, stats in self.last_stats.items() if stats.get("fallback")]
 
-        return final_prompt, features_raw, en_lyrics
\ No newline at end of file
+    def _print_translate_stats(self, stats):
+        totals = self.translate_totals
+        summary = (f"{totals['calls'] / totals['songs']:.2f} requests/song, "
+                   f"~{totals['saved_s']:.1f}s saved over {totals['songs']} songs")
+        if stats["skipped"]:
+            print(f"TRANSLATE: skipped (English) | {summary}")
+        else:
+            print(f"TRANSLATE: {stats['calls']} requests in {stats['latency_s']:.2f}s, "
+                  f"{stats['cached']} lines cached, {stats['repeats']} repeats | {summary}")
\ No newline at end of file